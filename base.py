@@ -1,60 +1,403 @@
+import asyncio
+import json
 import aiohttp
+from contextlib import contextmanager
+from checkpoint import Checkpoint
+from embedding_cache import EmbeddingCache
+from embedding_codec import JSON_MEDIA_TYPE, decode_embeddings, request_headers
+from local_index import LocalClient, LOCAL_INDEX_DIR
+from query_cache import QueryCache, PER_QUERY_FIELDS
+from replicas import ReplicaPool
+from tracing import Tracer
+from sharding import ShardedCollection, shard_name
+from snapshot import RESTORE_BATCH_SIZE, SNAPSHOT_PAGE_SIZE, export_collection, import_snapshot
 from chromadb import AsyncHttpClient
 from chromadb.config import Settings
 from chromadb.api.types import Documents, Metadatas, IDs
 
 
 class ChromaManager:
-    def __init__(self, collection_name: str):
+    def __init__(
+        self,
+        collection_name: str,
+        max_concurrency: int = 16,
+        request_timeout: float = 30.0,
+        max_retries: int = 3,
+        retry_backoff: float = 0.5,
+        cache: EmbeddingCache = None,
+        backend: str = "chroma",
+        local_root: str = LOCAL_INDEX_DIR,
+        index_options: dict = None,
+        query_cache: QueryCache = None,
+        response_format: str = "json",
+        embed_batch_size: int = 0,
+        num_shards: int = 1,
+        hosts: list[str] = None,
+        embed_urls: list[str] = None,
+        hedge_after: float = None,
+        tracer: Tracer = None,
+    ):
         self.host = "http://127.0.0.1:7000"  # your Chroma server
         self.collection_name = collection_name
         self.auth_token = "When_a_man_walks_away_he_is_never_the_same_as_when_he_came"  # your auth token
         self.embed_url = "http://127.0.0.1:8000/embed"  # local embedding service
+        self.model_name = "jinaai/jina-embeddings-v3"  # model served by the embedding service
+        self.task = "text-matching"  # task adapter the service encodes with
         self.client = None
         self.collection = None
 
+        # With num_shards > 1 the collection is split by id hash into shard collections,
+        # placed round-robin over `hosts` (several Chroma servers), or all on `host`
+        self.num_shards = num_shards
+        self.hosts = hosts
+        self.clients = []
+
+        # "chroma" talks to the server above; "local" keeps an exact-search index on disk
+        if backend not in ("chroma", "local"):
+            raise ValueError(f"Unknown backend '{backend}'")
+        self.backend = backend
+        self.local_root = local_root
+        self.index_options = index_options or {}
+
+        # Embedding client: one pooled session shared by every call, opened in connect()
+        self.max_concurrency = max_concurrency
+        self.request_timeout = request_timeout
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.session = None
+        self._embed_semaphore = None
+
+        # Several embedding replicas can be given as embed_urls; each request goes to the
+        # least-busy healthy one, and one still running after hedge_after seconds is also
+        # sent to a second replica. max_concurrency applies per replica.
+        self.embed_urls = embed_urls
+        self.hedge_after = hedge_after
+        self.replicas = None
+
+        # "float32"/"float16" ask for raw little-endian bytes, "msgpack" for a msgpack frame;
+        # both decode straight into NumPy arrays instead of per-float Python objects
+        self.response_format = response_format
+        self._accept_headers = request_headers(response_format)
+        self.embed_batch_size = embed_batch_size
+
+        # Optional on-disk cache consulted before calling the embedding service
+        self.cache = cache
+
+        # Optional in-process cache of query results, invalidated by writes
+        self.query_cache = query_cache
+
+        # Instrumentation hook: per-stage spans (query, embed, http, search, write); no-op by default
+        self.tracer = tracer or Tracer()
+
     async def connect(self):
         """Initialize the async client and get/create a collection."""
-        settings = Settings(
-            chroma_client_auth_provider="chromadb.auth.token.TokenAuthClientProvider",
-            chroma_client_auth_credentials=self.auth_token,
-        )
+        if self.backend == "local":
+            self.clients = [LocalClient(self.local_root, **self.index_options)]
+        else:
+            settings = Settings(
+                chroma_client_auth_provider="chromadb.auth.token.TokenAuthClientProvider",
+                chroma_client_auth_credentials=self.auth_token,
+            )
+
+            # ✅ must await the AsyncHttpClient creation
+            self.clients = [await AsyncHttpClient(host=host, settings=settings) for host in self.hosts or [self.host]]
+        self.client = self.clients[0]
+
+        if self.num_shards > 1:
+            shards = await asyncio.gather(*(
+                self._shard_client(shard).get_or_create_collection(name=shard_name(self.collection_name, shard, self.num_shards))
+                for shard in range(self.num_shards)
+            ))
+            self.collection = ShardedCollection(self.collection_name, list(shards))
+        else:
+            self.collection = await self.client.get_or_create_collection(name=self.collection_name)
+        await self._open_session()
+        await self.tracer.start()
+
+    def _shard_client(self, shard: int):
+        return self.clients[shard % len(self.clients)]
 
-        # ✅ must await the AsyncHttpClient creation
-        self.client = await AsyncHttpClient(host=self.host, settings=settings)
-        self.collection = await self.client.get_or_create_collection(name=self.collection_name)
+    async def _open_session(self):
+        """Open the pooled HTTP session used for all embedding requests."""
+        if self.replicas is not None:
+            await self.replicas.stop()
+        self.replicas = ReplicaPool(self.embed_urls or [self.embed_url], hedge_after=self.hedge_after)
+        limit = self.max_concurrency * len(self.replicas)
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=limit, keepalive_timeout=60)
+            timeout = aiohttp.ClientTimeout(total=self.request_timeout)
+            self.session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        self._embed_semaphore = asyncio.Semaphore(limit)
+        await self.replicas.start(self.session)
+
+    async def _close_session(self):
+        if self.replicas is not None:
+            await self.replicas.stop()
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def _cache_key(self, text: str) -> str:
+        return EmbeddingCache.key(self.model_name, self.task, text)
+
+    def _from_cache(self, text: str):
+        if self.cache is None:
+            return None
+        cached = self.cache.get(self._cache_key(text))
+        if cached is None or self.response_format != "json":
+            return cached
+        return cached.tolist()
+
+    def _to_cache(self, text: str, embedding):
+        if self.cache is not None:
+            self.cache.put(self._cache_key(text), embedding)
 
     async def _get_embedding(self, text: str):
-        """Fetch embedding asynchronously from /embed API."""
-        async with aiohttp.ClientSession() as session:
-            async with session.post(self.embed_url, json={"text": text}) as resp:
-                resp.raise_for_status()
-                data = await resp.json()
-                return data.get("embedding") or data
-
-    async def create(self, ids: IDs, documents: Documents, metadatas: Metadatas = None):
-        """Add documents to the collection with auto embeddings."""
-        embeddings = [await self._get_embedding(doc) for doc in documents]
-        return await self.collection.add(ids=ids, documents=documents, metadatas=metadatas, embeddings=embeddings)
+        """Fetch embedding from the cache, or from the /embed API on a miss."""
+        cached = self._from_cache(text)
+        if cached is not None:
+            return cached
+        embedding = (await self._post_embed("", {"text": text}))[0]
+        self._to_cache(text, embedding)
+        return embedding
+
+    async def _get_embeddings(self, texts: list[str]):
+        """
+        Embed many texts concurrently, bounded by max_concurrency; keeps input order.
+
+        With embed_batch_size > 1, cache misses are sent to /embed/batch in groups
+        of that size instead of one request per text.
+        """
+        if self.embed_batch_size <= 1:
+            return list(await asyncio.gather(*(self._get_embedding(text) for text in texts)))
+
+        embeddings = [self._from_cache(text) for text in texts]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        batches = [missing[start:start + self.embed_batch_size] for start in range(0, len(missing), self.embed_batch_size)]
+        fetched = await asyncio.gather(*(
+            self._post_embed("/batch", {"texts": [texts[i] for i in batch]}) for batch in batches
+        ))
+        for batch, batch_embeddings in zip(batches, fetched):
+            for i, embedding in zip(batch, batch_embeddings):
+                embeddings[i] = embedding
+                self._to_cache(texts[i], embedding)
+        return embeddings
+
+    async def _post_embed(self, route: str, payload: dict):
+        """
+        POST to an embedding replica's /embed{route}, retrying transient failures.
+
+        Returns a list of embeddings: Python lists for JSON responses, rows of a
+        float32 NumPy array for binary and msgpack responses.
+        """
+        if self.session is None:
+            raise RuntimeError("ChromaManager is not connected. Call connect() first.")
+
+        async def request(replica):
+            with self.tracer.span("http", route=route or "/", replica=replica.embed_url):
+                async with self.session.post(replica.embed_url + route, json=payload, headers=self._accept_headers) as resp:
+                    resp.raise_for_status()
+                    if resp.content_type != JSON_MEDIA_TYPE:
+                        return list(decode_embeddings(await resp.read(), resp.content_type, resp.headers))
+                    return await resp.json()
+
+        async with self._embed_semaphore:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    data = await self.replicas.call(request)
+                    break
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    client_error = isinstance(e, aiohttp.ClientResponseError) and e.status < 500
+                    if client_error or attempt == self.max_retries:
+                        raise
+                    await asyncio.sleep(self.retry_backoff * (2 ** attempt))
+
+        if isinstance(data, list):
+            return data
+        if "error" in data:
+            raise RuntimeError(f"Embedding service error: {data['error']}")
+        if "embeddings" in data:
+            return data["embeddings"]
+        return [data.get("embedding")]
+
+    async def stream_embeddings(self, records, window: int = 1024):
+        """
+        Embed an async iterable of (id, text) pairs over a single /embed/stream request.
+
+        Yields (id, embedding) pairs in input order as the service produces them.
+        At most `window` records are sent ahead of the results received, which keeps
+        client memory bounded; it must exceed the server's STREAM_BATCH_SIZE.
+        """
+        if self.session is None:
+            raise RuntimeError("ChromaManager is not connected. Call connect() first.")
+        slots = asyncio.Semaphore(window)
+
+        async def body():
+            async for record_id, text in records:
+                await slots.acquire()
+                yield (json.dumps({"id": record_id, "text": text}, ensure_ascii=False) + "\n").encode("utf-8")
+
+        # No total timeout for a whole-corpus stream; only a stall between lines fails it
+        timeout = aiohttp.ClientTimeout(total=None, sock_read=self.request_timeout)
+        headers = {"Content-Type": "application/x-ndjson"}
+        stream_url = self.replicas.pick().embed_url + "/stream"
+        async with self.session.post(stream_url, data=body(), headers=headers, timeout=timeout) as resp:
+            resp.raise_for_status()
+            async for line in resp.content:
+                if not line.strip():
+                    continue
+                slots.release()
+                result = json.loads(line)
+                if "error" in result:
+                    raise RuntimeError(f"Embedding service error for record {result.get('id')}: {result['error']}")
+                yield result["id"], result["embedding"]
+
+    async def create(self, ids: IDs, documents: Documents, metadatas: Metadatas = None, embeddings=None):
+        """Add documents to the collection, embedding them unless embeddings are given."""
+        if embeddings is None:
+            with self.tracer.span("embed", texts=len(documents)):
+                embeddings = await self._get_embeddings(documents)
+        with self._invalidating(), self.tracer.span("write", records=len(ids)):
+            return await self.collection.add(ids=ids, documents=documents, metadatas=metadatas, embeddings=embeddings)
+
+    async def upsert(self, ids: IDs, documents: Documents, metadatas: Metadatas = None, embeddings=None):
+        """Insert or overwrite documents, embedding them unless embeddings are given."""
+        if embeddings is None:
+            with self.tracer.span("embed", texts=len(documents)):
+                embeddings = await self._get_embeddings(documents)
+        with self._invalidating(), self.tracer.span("write", records=len(ids)):
+            return await self.collection.upsert(ids=ids, documents=documents, metadatas=metadatas, embeddings=embeddings)
+
+    async def delete(self, ids: IDs, batch_size: int = 1000):
+        """Delete documents by id in bulk batches."""
+        with self._invalidating():
+            for start in range(0, len(ids), batch_size):
+                await self.collection.delete(ids=ids[start:start + batch_size])
+
+    async def get_ids(self, page_size: int = 1000) -> set:
+        """Return every id in the collection, read in pages."""
+        ids, offset = set(), 0
+        while True:
+            page = await self.collection.get(include=[], limit=page_size, offset=offset)
+            ids.update(page["ids"])
+            if len(page["ids"]) < page_size:
+                return ids
+            offset += page_size
+
+    async def get_metadatas(self, page_size: int = 1000) -> dict:
+        """Return {id: metadata} for the whole collection, read in pages."""
+        metadatas, offset = {}, 0
+        while True:
+            page = await self.collection.get(include=["metadatas"], limit=page_size, offset=offset)
+            metadatas.update(zip(page["ids"], page.get("metadatas") or [None] * len(page["ids"])))
+            if len(page["ids"]) < page_size:
+                return metadatas
+            offset += page_size
+
+    async def update_metadatas(self, ids: IDs, metadatas: Metadatas, batch_size: int = 1000):
+        """Overwrite the metadata of existing records in bulk batches; nothing is re-embedded."""
+        with self._invalidating():
+            for start in range(0, len(ids), batch_size):
+                await self.collection.update(ids=ids[start:start + batch_size], metadatas=metadatas[start:start + batch_size])
+
+    async def export_snapshot(self, directory: str, page_size: int = SNAPSHOT_PAGE_SIZE) -> dict:
+        """Write ids, documents, metadata and stored vectors to a snapshot directory."""
+        with self.tracer.span("export", directory=directory) as attrs:
+            manifest = await export_collection(self.collection, directory, page_size=page_size, name=self.collection_name)
+            attrs["records"] = manifest["count"]
+        return manifest
+
+    async def import_snapshot(self, directory: str, batch_size: int = RESTORE_BATCH_SIZE) -> int:
+        """Restore a snapshot into this collection with its stored vectors; nothing is re-embedded."""
+        with self._invalidating(), self.tracer.span("import", directory=directory) as attrs:
+            attrs["records"] = await import_snapshot(self.collection, directory, batch_size=batch_size)
+        return attrs["records"]
 
     async def check_current_doc_count(self):
-        collection = await self.client.get_collection(self.collection_name)
-        count = await collection.count()
+        if self.num_shards > 1:
+            count = await self.collection.count()
+        else:
+            collection = await self.client.get_collection(self.collection_name)
+            count = await collection.count()
         print(f"📊 Current document count in ChromaDB collection '{self.collection_name}': {count}")
 
+    def shard_latencies(self, reset: bool = False) -> dict:
+        """Recent per-shard query latency; empty for an unsharded collection."""
+        if not isinstance(self.collection, ShardedCollection):
+            return {}
+        report = self.collection.latency_report()
+        if reset:
+            self.collection.reset_latencies()
+        return report
+
 
     async def query(self, query_texts: list[str], n_results: int = 3):
-        """Search using auto-generated embeddings."""
-        query_embeddings = [await self._get_embedding(text) for text in query_texts]
-        return await self.collection.query(query_embeddings=query_embeddings, n_results=n_results)
-    
+        """Search using auto-generated embeddings, serving repeats from the query cache."""
+        with self.tracer.span("query", queries=len(query_texts), n_results=n_results) as span:
+            if self.query_cache is None:
+                return await self._search(query_texts, n_results)
+
+            keys = [self.query_cache.key(self.collection_name, text, n_results) for text in query_texts]
+            per_query = [self.query_cache.get(key) for key in keys]
+            missing = [i for i, result in enumerate(per_query) if result is None]
+            span["cache_hits"] = len(query_texts) - len(missing)
+            if missing:
+                fresh = await self._search([query_texts[i] for i in missing], n_results)
+                for j, i in enumerate(missing):
+                    per_query[i] = {field: fresh[field][j] for field in PER_QUERY_FIELDS if fresh.get(field) is not None}
+                    self.query_cache.put(keys[i], per_query[i])
+
+            return {
+                field: [result[field] for result in per_query] if all(field in result for result in per_query) else None
+                for field in PER_QUERY_FIELDS
+            }
+
+    async def _search(self, query_texts: list[str], n_results: int):
+        with self.tracer.span("embed", texts=len(query_texts)):
+            query_embeddings = await self._get_embeddings(query_texts)
+        with self.tracer.span("search", queries=len(query_texts), n_results=n_results, shards=self.num_shards):
+            return await self.collection.query(query_embeddings=query_embeddings, n_results=n_results)
+
+    def _invalidate_queries(self):
+        if self.query_cache is not None:
+            self.query_cache.invalidate(self.collection_name)
+
+    @contextmanager
+    def _invalidating(self):
+        """
+        Invalidate cached queries before and after a write.
+
+        The second bump drops results of queries that ran while the write was in
+        flight: they read the old collection but were cached under the first bump.
+        """
+        self._invalidate_queries()
+        try:
+            yield
+        finally:
+            self._invalidate_queries()
+
     async def delete_collection(self):
-        """Completely delete the collection."""
-        await self.client.delete_collection(name=self.collection_name)
+        """Completely delete the collection and any ingest checkpoint recorded for it."""
+        Checkpoint.discard(self.collection_name)
+        with self._invalidating():
+            if self.num_shards > 1:
+                await asyncio.gather(*(
+                    self._shard_client(shard).delete_collection(name=shard_name(self.collection_name, shard, self.num_shards))
+                    for shard in range(self.num_shards)
+                ))
+            else:
+                await self.client.delete_collection(name=self.collection_name)
         print(f"🗑️ Collection '{self.collection_name}' deleted.")
 
     async def disconnect(self):
         """Close the client cleanly."""
+        await self._close_session()
+        await self.tracer.close()
+        if self.cache is not None:
+            self.cache.flush()
+        for client in self.clients:
+            if isinstance(client, LocalClient):
+                client.close()
+        self.clients = []
         if self.client:
             self.client = None
-
@@ -0,0 +1,191 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+from chroma_retriever import ChromaRetriever
+from latency_stats import summarize
+from stub_embedding_server import start_stub_server, STUB_PORT
+
+SCIFACT_COLLECTION_NAME = "scifact_collection"
+SCIFACT_DATA_PATH = r"D:\project\dense_retrieval_rag\datasets\scifact"
+
+SCIDOCS_COLLECTION_NAME = "scidocs_collection"
+SCIDOCS_DATA_PATH = r"D:\project\dense_retrieval_rag\datasets\scidocs"
+
+CONCURRENCY_LEVELS = [1, 4, 16]
+STAGES = ["embed", "search", "convert"]
+
+
+def load_queries(data_path: str, limit: int = None) -> dict:
+    """Read {query_id: text} from a BEIR queries.jsonl without loading the corpus."""
+    queries = {}
+    with open(os.path.join(data_path, "queries.jsonl"), "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            query = json.loads(line)
+            queries[query["_id"]] = query["text"]
+            if limit and len(queries) >= limit:
+                break
+    return queries
+
+
+async def timed_query(retriever: ChromaRetriever, query_id: str, text: str, top_k: int) -> dict:
+    """Run one query through the retrieval path, timing each stage in milliseconds."""
+    manager = retriever.manager
+    t0 = time.perf_counter()
+    embeddings = await manager._get_embeddings([text])
+    t1 = time.perf_counter()
+    chroma_results = await manager.collection.query(query_embeddings=embeddings, n_results=top_k)
+    t2 = time.perf_counter()
+    retriever.to_beir([query_id], chroma_results)
+    t3 = time.perf_counter()
+    return {
+        "total": (t3 - t0) * 1000,
+        "embed": (t1 - t0) * 1000,
+        "search": (t2 - t1) * 1000,
+        "convert": (t3 - t2) * 1000,
+    }
+
+
+async def run_level(retriever: ChromaRetriever, queries: dict, concurrency: int, top_k: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def worker(query_id, text):
+        async with semaphore:
+            return await timed_query(retriever, query_id, text, top_k)
+
+    start = time.perf_counter()
+    timings = await asyncio.gather(*(worker(qid, text) for qid, text in queries.items()))
+    wall = time.perf_counter() - start
+
+    return {
+        "concurrency": concurrency,
+        "queries": len(timings),
+        "wall_seconds": wall,
+        "qps": len(timings) / wall if wall else 0.0,
+        "latency_ms": summarize([t["total"] for t in timings]),
+        "stages_ms": {stage: summarize([t[stage] for t in timings]) for stage in STAGES},
+    }
+
+
+def print_level(level: dict):
+    latency = level["latency_ms"]
+    stages = " | ".join(f"{stage} {level['stages_ms'][stage]['mean']:.1f}" for stage in STAGES)
+    print(f"  c={level['concurrency']:<3} QPS {level['qps']:8.1f} | "
+          f"p50 {latency['p50']:7.1f} ms  p95 {latency['p95']:7.1f} ms  p99 {latency['p99']:7.1f} ms | "
+          f"mean ms: {stages}")
+
+
+def compare_to_baseline(report: dict, baseline: dict, tolerance: float) -> list:
+    """Print per-level deltas against a saved report; return descriptions of regressions."""
+    regressions = []
+    baseline_levels = {level["concurrency"]: level for level in baseline.get("levels", [])}
+    print(f"\n📐 Compared with baseline from {baseline.get('timestamp', 'unknown')} (tolerance {tolerance:.0%}):")
+    for level in report["levels"]:
+        old = baseline_levels.get(level["concurrency"])
+        if old is None:
+            continue
+        qps_delta = (level["qps"] - old["qps"]) / old["qps"] if old["qps"] else 0.0
+        line = f"  c={level['concurrency']:<3} QPS {qps_delta:+.1%}"
+        if qps_delta < -tolerance:
+            regressions.append(f"c={level['concurrency']} QPS {qps_delta:+.1%}")
+        for p in ("p50", "p95", "p99"):
+            before, after = old["latency_ms"][p], level["latency_ms"][p]
+            delta = (after - before) / before if before else 0.0
+            line += f"  {p} {delta:+.1%}"
+            if delta > tolerance:
+                regressions.append(f"c={level['concurrency']} {p} {delta:+.1%}")
+        print(line)
+    return regressions
+
+
+async def run_benchmark(
+    data_path: str,
+    collection_name: str,
+    backend: str = "chroma",
+    concurrency_levels=CONCURRENCY_LEVELS,
+    top_k: int = 10,
+    max_queries: int = None,
+    use_stub: bool = False,
+    stub_port: int = STUB_PORT,
+    num_shards: int = 1,
+) -> dict:
+    queries = load_queries(data_path, max_queries)
+    print(f"⏱️ Benchmarking {len(queries)} queries against '{collection_name}' ({backend} backend)")
+
+    stub_runner = None
+    if use_stub:
+        stub_runner = await start_stub_server(port=stub_port)
+        print(f"🧪 Using stub embedding server on port {stub_port}")
+
+    embed_urls = [f"http://127.0.0.1:{stub_port}/embed"] if use_stub else None
+    retriever = ChromaRetriever(collection_name=collection_name, backend=backend, num_shards=num_shards, embed_urls=embed_urls)
+    await retriever.connect()
+
+    try:
+        # One untimed pass to open connections and warm caches on both servers
+        await run_level(retriever, dict(list(queries.items())[:min(len(queries), 8)]), 1, top_k)
+        retriever.manager.shard_latencies(reset=True)
+
+        levels = []
+        for concurrency in concurrency_levels:
+            level = await run_level(retriever, queries, concurrency, top_k)
+            print_level(level)
+            level["shard_latency_ms"] = retriever.manager.shard_latencies(reset=True)
+            for shard, stats in level["shard_latency_ms"].items():
+                print(f"      shard {shard}: mean {stats['mean_ms']:6.1f} ms  p95 {stats['p95_ms']:6.1f} ms  max {stats['max_ms']:6.1f} ms")
+            levels.append(level)
+    finally:
+        await retriever.disconnect()
+        if stub_runner is not None:
+            await stub_runner.cleanup()
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "collection": collection_name,
+        "backend": backend,
+        "stub_embeddings": use_stub,
+        "shards": num_shards,
+        "top_k": top_k,
+        "queries": len(queries),
+        "levels": levels,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Retrieval latency/throughput benchmark over BEIR queries.")
+    parser.add_argument("--data-path", default=SCIDOCS_DATA_PATH, help="BEIR dataset folder containing queries.jsonl")
+    parser.add_argument("--collection", default=SCIDOCS_COLLECTION_NAME)
+    parser.add_argument("--backend", choices=["chroma", "local"], default="chroma")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=CONCURRENCY_LEVELS)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--max-queries", type=int, help="Replay only the first N queries")
+    parser.add_argument("--stub", action="store_true", help="Serve embeddings from an in-process stub instead of the model")
+    parser.add_argument("--shards", type=int, default=1, help="Query a collection split into this many shards")
+    parser.add_argument("--output", help="Write the JSON report here")
+    parser.add_argument("--baseline", help="Compare with a previously saved JSON report")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Relative change counted as a regression")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_benchmark(
+        args.data_path, args.collection, args.backend, args.concurrency,
+        args.top_k, args.max_queries, args.stub, num_shards=args.shards,
+    ))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Report written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare_to_baseline(report, json.load(f), args.tolerance)
+        if regressions:
+            print("❌ Regressions: " + ", ".join(regressions))
+            sys.exit(1)
+        print("✅ No regressions beyond tolerance.")
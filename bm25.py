@@ -0,0 +1,166 @@
+import argparse
+import json
+import os
+import re
+from collections import Counter
+
+import numpy as np
+
+from indexing import chunk_id, iter_chunks
+
+BM25_INDEX_DIR = "bm25_index"
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> list[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def iter_corpus(path: str):
+    """
+    Yield (doc_id, text) pairs from a BEIR corpus.jsonl or convert-md.py chunk file.
+
+    Ids match what the dense collection stores in metadata['_id']: the BEIR `_id`
+    for corpus documents and the content-hash chunk id for chunks.
+    """
+    for record in iter_chunks(path):
+        if record.get("content"):
+            yield chunk_id(record), f"{record.get('title', '')} {record['content']}"
+        elif record.get("text"):
+            yield record["_id"], f"{record.get('title', '')} {record['text']}"
+
+
+def source_state(path: str) -> dict:
+    """Identify a corpus file by path, size and mtime so a stale index can be detected."""
+    stat = os.stat(path)
+    return {"path": os.path.abspath(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+class BM25Index:
+    """
+    Okapi BM25 over an inverted index stored as CSR arrays.
+
+    Postings for term t are doc_rows[offsets[t]:offsets[t + 1]] with matching
+    term_freqs, so the whole index is four flat numpy arrays plus the vocabulary.
+    Saved indexes are loaded with np.load(mmap_mode="r") and only the postings of
+    the query terms are paged in.
+    """
+
+    def __init__(self, k1: float = 0.9, b: float = 0.4):
+        self.k1 = k1
+        self.b = b
+        self.vocab = {}  # term -> row in offsets
+        self.doc_ids = []
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.doc_rows = np.zeros(0, dtype=np.int32)
+        self.term_freqs = np.zeros(0, dtype=np.uint16)
+        self.doc_lengths = np.zeros(0, dtype=np.int32)
+        self.source = None  # corpus the index was built from, see source_state()
+        self._prepare()
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def _prepare(self):
+        n_docs = len(self.doc_ids)
+        avg_length = float(self.doc_lengths.mean()) if n_docs else 0.0
+        # Per-document part of the BM25 denominator, computed once
+        self.length_norms = (self.k1 * (1 - self.b + self.b * self.doc_lengths / avg_length)).astype(np.float32) if n_docs else np.zeros(0, dtype=np.float32)
+        doc_freqs = np.diff(self.offsets)
+        self.idf = np.log1p((n_docs - doc_freqs + 0.5) / (doc_freqs + 0.5)).astype(np.float32)
+
+    @classmethod
+    def build(cls, records, k1: float = 0.9, b: float = 0.4):
+        """Build an index from an iterable of (doc_id, text) pairs."""
+        index = cls(k1=k1, b=b)
+        term_rows, doc_rows, term_freqs, doc_lengths = [], [], [], []
+        for doc_id, text in records:
+            counts = Counter(tokenize(text))
+            row = len(index.doc_ids)
+            index.doc_ids.append(doc_id)
+            doc_lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                term_rows.append(index.vocab.setdefault(term, len(index.vocab)))
+                doc_rows.append(row)
+                term_freqs.append(min(tf, np.iinfo(np.uint16).max))
+
+        term_rows = np.asarray(term_rows, dtype=np.int32)
+        order = np.argsort(term_rows, kind="stable")  # stable keeps each posting list in doc order
+        index.offsets = np.zeros(len(index.vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_rows, minlength=len(index.vocab)), out=index.offsets[1:])
+        index.doc_rows = np.asarray(doc_rows, dtype=np.int32)[order]
+        index.term_freqs = np.asarray(term_freqs, dtype=np.uint16)[order]
+        index.doc_lengths = np.asarray(doc_lengths, dtype=np.int32)
+        index._prepare()
+        return index
+
+    @classmethod
+    def from_path(cls, path: str, **options):
+        source = source_state(path)
+        index = cls.build(iter_corpus(path), **options)
+        index.source = source
+        return index
+
+    def save(self, directory: str = BM25_INDEX_DIR):
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "offsets.npy"), self.offsets)
+        np.save(os.path.join(directory, "doc_rows.npy"), self.doc_rows)
+        np.save(os.path.join(directory, "term_freqs.npy"), self.term_freqs)
+        np.save(os.path.join(directory, "doc_lengths.npy"), self.doc_lengths)
+        with open(os.path.join(directory, "vocab.json"), "w", encoding="utf-8") as f:
+            json.dump({"k1": self.k1, "b": self.b, "source": self.source, "doc_ids": self.doc_ids, "vocab": self.vocab}, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, directory: str = BM25_INDEX_DIR, mmap: bool = True):
+        with open(os.path.join(directory, "vocab.json"), "r", encoding="utf-8") as f:
+            state = json.load(f)
+        index = cls(k1=state["k1"], b=state["b"])
+        index.vocab, index.doc_ids = state["vocab"], state["doc_ids"]
+        index.source = state.get("source")
+        mode = "r" if mmap else None
+        index.offsets = np.load(os.path.join(directory, "offsets.npy"), mmap_mode=mode)
+        index.doc_rows = np.load(os.path.join(directory, "doc_rows.npy"), mmap_mode=mode)
+        index.term_freqs = np.load(os.path.join(directory, "term_freqs.npy"), mmap_mode=mode)
+        index.doc_lengths = np.load(os.path.join(directory, "doc_lengths.npy"), mmap_mode=mode)
+        index._prepare()
+        return index
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every document for the query."""
+        scores = np.zeros(len(self.doc_ids), dtype=np.float32)
+        for term, query_tf in Counter(tokenize(query)).items():
+            row = self.vocab.get(term)
+            if row is None:
+                continue
+            start, stop = self.offsets[row], self.offsets[row + 1]
+            docs = self.doc_rows[start:stop]
+            tf = self.term_freqs[start:stop].astype(np.float32)
+            scores[docs] += query_tf * self.idf[row] * tf * (self.k1 + 1) / (tf + self.length_norms[docs])
+        return scores
+
+    def search(self, query: str, k: int = 10) -> list[tuple[str, float]]:
+        """Top-k (doc_id, score) pairs, best first; documents sharing no term are left out."""
+        scores = self.scores(query)
+        k = min(k, len(scores))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self.doc_ids[row], float(scores[row])) for row in top if scores[row] > 0]
+
+    def retrieve(self, queries: dict, top_k: int = 10) -> dict:
+        """BEIR-format {query_id: {doc_id: score}} results."""
+        return {query_id: dict(self.search(text, top_k)) for query_id, text in queries.items()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a BM25 index from a corpus.jsonl or chunk file.")
+    parser.add_argument("path", help="BEIR corpus.jsonl or convert-md.py chunk .json/.jsonl")
+    parser.add_argument("--output-dir", default=BM25_INDEX_DIR)
+    parser.add_argument("--k1", type=float, default=0.9)
+    parser.add_argument("--b", type=float, default=0.4)
+    args = parser.parse_args()
+
+    index = BM25Index.from_path(args.path, k1=args.k1, b=args.b)
+    index.save(args.output_dir)
+    print(f"✅ Indexed {len(index)} documents, {len(index.vocab)} terms, {len(index.doc_rows)} postings into '{args.output_dir}'")
@@ -0,0 +1,49 @@
+import json
+import os
+
+CHECKPOINT_DIR = "checkpoints"
+
+
+class Checkpoint:
+    """
+    Durable record of how far into a corpus file an ingest has got.
+
+    The file is replaced atomically after every written batch, so after a crash
+    the ingest resumes from the last batch that actually reached the collection.
+    """
+
+    def __init__(self, collection_name: str, corpus_path: str, directory: str = CHECKPOINT_DIR):
+        self.path = os.path.join(directory, f"{collection_name}.json")
+        self.corpus_path = os.path.abspath(corpus_path)
+        self.line = 0
+        self.indexed = 0
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return self
+        with open(self.path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("corpus_path") == self.corpus_path:
+            self.line = state.get("line", 0)
+            self.indexed = state.get("indexed", 0)
+        return self
+
+    def save(self, line: int, indexed: int):
+        self.line, self.indexed = line, indexed
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"corpus_path": self.corpus_path, "line": line, "indexed": indexed}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        self.line = self.indexed = 0
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    @classmethod
+    def discard(cls, collection_name: str, directory: str = CHECKPOINT_DIR):
+        """Forget any ingest progress recorded for a collection, e.g. when it is deleted."""
+        cls(collection_name, "", directory).clear()
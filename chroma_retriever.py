@@ -1,5 +1,13 @@
 from base import ChromaManager
-from typing import Dict
+from bm25 import BM25Index
+from embedding_cache import EmbeddingCache
+from sinks import JsonlSink
+from tracing import Tracer
+from typing import Dict, List
+import asyncio
+import time
+
+RRF_K = 60
 
 
 class ChromaRetriever:
@@ -8,17 +16,45 @@ class ChromaRetriever:
     Converts ChromaDB query results to BEIR-compatible format.
     """
     
-    def __init__(self, collection_name: str):
-        self.manager = ChromaManager(collection_name=collection_name)
+    def __init__(
+        self,
+        collection_name: str,
+        cache: EmbeddingCache = None,
+        backend: str = "chroma",
+        index_options: dict = None,
+        batch_size: int = 64,
+        max_in_flight: int = 4,
+        debug_path: str = None,
+        debug_sample_rate: float = 0.01,
+        tracer: Tracer = None,
+        num_shards: int = 1,
+        hosts: list[str] = None,
+        embed_urls: list[str] = None,
+    ):
+        self.manager = ChromaManager(
+            collection_name=collection_name, cache=cache, backend=backend, index_options=index_options, tracer=tracer,
+            num_shards=num_shards, hosts=hosts, embed_urls=embed_urls,
+        )
         self.connected = False
+
+        # Queries are sent in batches of batch_size with up to max_in_flight batches at once
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+
+        # Opt-in sampled dump of raw per-query results, written off the hot path
+        self.debug_sink = JsonlSink(debug_path, sample_rate=debug_sample_rate) if debug_path else None
     
     async def connect(self):
         """Initialize the ChromaDB connection."""
         await self.manager.connect()
+        if self.debug_sink is not None:
+            await self.debug_sink.start()
         self.connected = True
     
     async def disconnect(self):
         """Close the ChromaDB connection."""
+        if self.debug_sink is not None:
+            await self.debug_sink.close()
         await self.manager.disconnect()
         self.connected = False
     
@@ -38,17 +74,54 @@ class ChromaRetriever:
         if not self.connected:
             raise RuntimeError("ChromaRetriever is not connected. Call connect() first.")
         
-        results = {}
         query_ids = list(queries.keys())
-        query_texts = [queries[qid] for qid in query_ids]
-        
-        # Query ChromaDB for all queries
-        chroma_results = await self.manager.query(query_texts=query_texts, n_results=top_k)
-        with open("chroma_debug.json", "w", encoding="utf-8") as debug_file:
-            import json
-            json.dump(chroma_results, debug_file, indent=2)
-        
-        # Convert ChromaDB results to BEIR format
+        semaphore = asyncio.Semaphore(self.max_in_flight)
+
+        tracer = self.manager.tracer
+
+        async def run_batch(batch_ids):
+            # One trace per batch: retrieve > query > embed/http/search, then convert
+            with tracer.span("retrieve", queries=len(batch_ids)):
+                async with semaphore:
+                    chroma_results = await self.manager.query(query_texts=[queries[qid] for qid in batch_ids], n_results=top_k)
+                with tracer.span("convert", queries=len(batch_ids)):
+                    beir_results = self.to_beir(batch_ids, chroma_results)
+            return batch_ids, chroma_results, beir_results
+
+        # Query ChromaDB in batches and merge each batch into the results as it arrives
+        tasks = [
+            asyncio.create_task(run_batch(query_ids[start:start + self.batch_size]))
+            for start in range(0, len(query_ids), self.batch_size)
+        ]
+        results = {}
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                batch_ids, chroma_results, beir_results = await next_done
+                results.update(beir_results)
+                if self.debug_sink is not None:
+                    self._sample_debug(batch_ids, chroma_results)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+        return results
+
+    def _sample_debug(self, batch_ids, chroma_results):
+        for idx, query_id in enumerate(batch_ids):
+            if self.debug_sink.sampled():
+                self.debug_sink.write({
+                    "query_id": query_id,
+                    "ids": chroma_results["ids"][idx],
+                    "distances": chroma_results["distances"][idx],
+                    "metadatas": chroma_results["metadatas"][idx],
+                }, sample=False)
+
+    @staticmethod
+    def to_beir(query_ids, chroma_results) -> Dict[str, Dict[str, float]]:
+        """Convert a ChromaDB query response into BEIR's {query_id: {doc_id: score}} format."""
+        results = {}
+
         # ChromaDB returns results with indices corresponding to input queries
         for idx, query_id in enumerate(query_ids):
             results[query_id] = {}
@@ -60,7 +133,7 @@ class ChromaRetriever:
             # Extract the actual document IDs from metadata (not ChromaDB UUIDs)
             for metadata, distance in zip(metadatas, distances):
                 # The actual document ID is stored in metadata['_id']
-                doc_id = metadata.get('_id', None)
+                doc_id = (metadata or {}).get('_id', None)
                 
                 if doc_id:
                     # Convert distance to similarity score (higher is better)
@@ -95,3 +168,76 @@ class ChromaRetriever:
             'query_ids': query_ids,
             'chroma_results': chroma_results
         }
+
+
+class HybridRetriever:
+    """
+    Dense + BM25 retrieval fused with reciprocal-rank fusion.
+
+    Both retrievers return `candidates` results per query; a document scores
+    sum(1 / (rrf_k + rank)) over the lists it appears in, so the raw dense and
+    BM25 scores never need to be put on a common scale.
+    """
+
+    def __init__(
+        self,
+        collection_name: str,
+        bm25: BM25Index,
+        cache: EmbeddingCache = None,
+        backend: str = "chroma",
+        index_options: dict = None,
+        rrf_k: int = RRF_K,
+        candidates: int = 100,
+        num_shards: int = 1,
+        hosts: list[str] = None,
+        embed_urls: list[str] = None,
+    ):
+        self.dense = ChromaRetriever(
+            collection_name=collection_name, cache=cache, backend=backend, index_options=index_options,
+            num_shards=num_shards, hosts=hosts, embed_urls=embed_urls,
+        )
+        self.bm25 = bm25
+        self.rrf_k = rrf_k
+        self.candidates = candidates
+        self.timings = {}  # seconds spent per stage in the last retrieve()
+
+    @property
+    def manager(self):
+        return self.dense.manager
+
+    async def connect(self):
+        await self.dense.connect()
+
+    async def disconnect(self):
+        await self.dense.disconnect()
+
+    async def retrieve(self, corpus: Dict[str, Dict[str, str]], queries: Dict[str, str], top_k: int = 10) -> Dict[str, Dict[str, float]]:
+        candidates = max(self.candidates, top_k)
+
+        async def timed(name, coro):
+            start = time.perf_counter()
+            result = await coro
+            self.timings[name] = time.perf_counter() - start
+            return result
+
+        # BM25 scoring is CPU-bound numpy work, so it runs in a thread alongside the dense queries
+        dense, sparse = await asyncio.gather(
+            timed("dense", self.dense.retrieve(corpus, queries, top_k=candidates)),
+            timed("sparse", asyncio.to_thread(self.bm25.retrieve, queries, candidates)),
+        )
+        start = time.perf_counter()
+        results = {
+            query_id: self.reciprocal_rank_fusion([dense.get(query_id, {}), sparse.get(query_id, {})], top_k, self.rrf_k)
+            for query_id in queries
+        }
+        self.timings["fusion"] = time.perf_counter() - start
+        return results
+
+    @staticmethod
+    def reciprocal_rank_fusion(runs: List[Dict[str, float]], top_k: int = 10, rrf_k: int = RRF_K) -> Dict[str, float]:
+        """Fuse {doc_id: score} runs by rank; returns the top_k fused {doc_id: rrf_score}."""
+        fused = {}
+        for run in runs:
+            for rank, doc_id in enumerate(sorted(run, key=run.get, reverse=True), start=1):
+                fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (rrf_k + rank)
+        return dict(sorted(fused.items(), key=lambda item: item[1], reverse=True)[:top_k])
@@ -3,21 +3,23 @@ import re
 import json
 import os
 import sys
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 
 # === CONFIGURATION ===
 INPUT_FILE = "1905 Naga Hills and Manipur by Allen s.md"          # Input .md file
 MAX_TOKENS = 200
+OVERLAP_TOKENS = 0
 
-# --- Token counter ---
-def get_token_counter():
+# --- Tokenizer ---
+def get_encoder():
     try:
         import tiktoken
     except ImportError:
         sys.exit("Install tiktoken: pip install tiktoken")
-    enc = tiktoken.get_encoding("cl100k_base")
-    return lambda text: len(enc.encode(text))
+    return tiktoken.get_encoding("cl100k_base")
 
-token_count = get_token_counter()
+encoder = get_encoder()
 
 # --- Cleaning ---
 def clean_text(text):
@@ -60,18 +62,51 @@ def parse_table_rows(lines):
     return rows
 
 # --- Split text ---
-def split_by_tokens(text, max_tokens):
-    words = text.split()
-    chunks, current = [], []
-    for w in words:
-        candidate = " ".join(current + [w])
-        if token_count(candidate) <= max_tokens:
-            current.append(w)
-        else:
-            chunks.append(" ".join(current))
-            current = [w]
-    if current:
-        chunks.append(" ".join(current))
+def split_by_tokens(text, max_tokens, overlap=0):
+    """
+    Split text into chunks of at most max_tokens, tokenizing it only once.
+
+    Cuts are made on token offsets and moved back to the nearest word boundary;
+    consecutive chunks share roughly `overlap` tokens.
+    """
+    tokens = encoder.encode(text)
+    n = len(tokens)
+    if n <= max_tokens:
+        return [text] if text.strip() else []
+
+    _, offsets = encoder.decode_with_offsets(tokens)
+
+    def at_word_start(i):
+        pos = offsets[i]
+        return pos >= len(text) or text[pos].isspace() or (pos > 0 and text[pos - 1].isspace())
+
+    chunks, start, prev_end = [], 0, 0
+    overlap = min(overlap, max_tokens - 1)
+    while start < n:
+        end = min(start + max_tokens, n)
+        if end < n:
+            cut, floor = end, max(start, prev_end)
+            while cut > floor and not at_word_start(cut):
+                cut -= 1
+            if cut > floor:
+                end = cut
+            elif start < prev_end:
+                # No word boundary past the previous chunk within reach; drop the overlap
+                start = prev_end
+                continue
+            # otherwise a single word is longer than max_tokens; hard cut
+        prev_end = end
+
+        chunk = text[offsets[start]:offsets[end] if end < n else len(text)].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= n:
+            break
+
+        next_start = max(end - overlap, start + 1)
+        while next_start < end and not at_word_start(next_start):
+            next_start += 1
+        start = next_start
     return chunks
 
 # --- Regex patterns ---
@@ -134,46 +169,88 @@ def parse_markdown(md_text):
     flush_buffer()
     return sections
 
-# --- Convert one file ---
-def md_to_json(input_path, output_path):
-    with open(input_path, encoding="utf-8") as f:
-        text = f.read()
-
-    sections = parse_markdown(text)
-    json_data = []
-
+# --- Chunk sections ---
+def iter_chunks(sections, max_tokens=MAX_TOKENS, overlap=OVERLAP_TOKENS):
     for sec in sections:
         if sec.get("is_table", False):
             # For tables, create one object per row without token limit
             table_rows = sec.get("table_rows", [])
             for row in table_rows:
-                json_data.append({
+                yield {
                     "title": sec["Title"],
                     "content": " | ".join(row),
                     "is_table": True
-                })
+                }
         else:
             # For non-table content, split by tokens
-            chunks = split_by_tokens(sec["content"], MAX_TOKENS)
+            chunks = split_by_tokens(sec["content"], max_tokens, overlap)
             for chunk in chunks:
-                json_data.append({
+                yield {
                     "title": sec["Title"],
                     "content": chunk.strip(),
                     "is_table": False
-                })
+                }
+
+# --- Convert one file ---
+def md_to_jsonl(input_path, output_path, max_tokens=MAX_TOKENS, overlap=OVERLAP_TOKENS):
+    """Convert one markdown file, writing one JSON chunk per line as it is produced."""
+    with open(input_path, encoding="utf-8") as f:
+        text = f.read()
 
+    count = 0
     with open(output_path, "w", encoding="utf-8") as out:
-        json.dump(json_data, out, ensure_ascii=False, indent=2)
+        for chunk in iter_chunks(parse_markdown(text), max_tokens, overlap):
+            out.write(json.dumps(chunk, ensure_ascii=False) + "\n")
+            count += 1
 
-    print(f"✅ {os.path.basename(output_path)} — {len(json_data)} JSON objects saved.")
+    print(f"✅ {os.path.basename(output_path)} — {count} JSON objects saved.")
+    return count
+
+# --- Collect inputs ---
+def collect_md_files(inputs):
+    paths = []
+    for path in inputs:
+        if os.path.isdir(path):
+            paths.extend(
+                os.path.join(path, name) for name in sorted(os.listdir(path))
+                if name.lower().endswith(".md")
+            )
+        elif not os.path.exists(path):
+            sys.exit(f"[ERROR] File not found: {path}")
+        elif not path.lower().endswith(".md"):
+            sys.exit(f"[ERROR] Input file must be a .md file: {path}")
+        else:
+            paths.append(path)
+    return paths
+
+def convert_all(paths, output_dir=None, max_tokens=MAX_TOKENS, overlap=OVERLAP_TOKENS, workers=None):
+    """Convert every file in parallel, one process per file."""
+    jobs = []
+    for path in paths:
+        base = os.path.splitext(os.path.basename(path))[0] + ".jsonl"
+        jobs.append((path, os.path.join(output_dir or os.path.dirname(path), base)))
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    if len(jobs) == 1 or workers == 1:
+        return sum(md_to_jsonl(src, dst, max_tokens, overlap) for src, dst in jobs)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(md_to_jsonl, src, dst, max_tokens, overlap) for src, dst in jobs]
+        return sum(future.result() for future in futures)
 
 # --- Main ---
 if __name__ == "__main__":
-    if not os.path.exists(INPUT_FILE):
-        sys.exit(f"[ERROR] File not found: {INPUT_FILE}")
-
-    if not INPUT_FILE.lower().endswith(".md"):
-        sys.exit(f"[ERROR] Input file must be a .md file: {INPUT_FILE}")
+    parser = argparse.ArgumentParser(description="Convert markdown files into token-bounded JSONL chunks.")
+    parser.add_argument("inputs", nargs="*", default=[INPUT_FILE], help=".md files or directories of .md files")
+    parser.add_argument("--output-dir", help="Directory for the .jsonl files (default: next to each input)")
+    parser.add_argument("--max-tokens", type=int, default=MAX_TOKENS)
+    parser.add_argument("--overlap", type=int, default=OVERLAP_TOKENS, help="Tokens shared by consecutive chunks")
+    parser.add_argument("--workers", type=int, default=None, help="Parallel processes (default: CPU count)")
+    args = parser.parse_args()
 
-    output_path = os.path.splitext(INPUT_FILE)[0] + ".json"
-    md_to_json(INPUT_FILE, output_path)
+    paths = collect_md_files(args.inputs)
+    if not paths:
+        sys.exit("[ERROR] No .md files found.")
+    total = convert_all(paths, args.output_dir, args.max_tokens, args.overlap, args.workers)
+    print(f"📦 {len(paths)} file(s), {total} chunks.")
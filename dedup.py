@@ -0,0 +1,135 @@
+import argparse
+import hashlib
+import re
+
+import numpy as np
+
+PUNCTUATION = re.compile(r"[^\w\s]+")
+EMBEDDING_BYTES = 1024 * 4  # one float32 jina-embeddings-v3 vector
+
+
+def shingles(text: str, size: int = 5) -> set:
+    """
+    Character n-grams of the lower-cased words; robust to OCR typos.
+
+    Punctuation is dropped first so table boilerplate ("| ... |") does not make
+    rows with different values look alike.
+    """
+    text = " ".join(PUNCTUATION.sub(" ", text.lower()).split())
+    if len(text) <= size:
+        return {text}
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+class Deduplicator:
+    """
+    Streaming near-duplicate detection with MinHash signatures and LSH banding.
+
+    Texts are added in stream order. Each one is compared only with earlier
+    canonical texts sharing at least one LSH band; if the estimated Jaccard
+    similarity of their shingle sets reaches `threshold` it becomes an alias of
+    that canonical text, otherwise it becomes canonical itself.
+    """
+
+    def __init__(self, threshold: float = 0.8, num_perm: int = 128, bands: int = 16, shingle_size: int = 5, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        # Multiply-add-shift hashing: ((a * h + b) mod 2^64) >> 32 for 32-bit shingle hashes
+        self.a = rng.integers(0, 1 << 63, size=num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self.b = rng.integers(0, 1 << 63, size=num_perm, dtype=np.uint64)
+        self.buckets = [{} for _ in range(bands)]  # band hash -> canonical keys
+        self.signatures = {}  # canonical key -> signature
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little") for s in shingles(text, self.shingle_size)),
+            dtype=np.uint64,
+        )
+        permuted = (np.outer(hashes, self.a) + self.b) >> np.uint64(32)
+        return permuted.min(axis=0).astype(np.uint32)
+
+    def _bands(self, signature: np.ndarray):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def add(self, key, text: str):
+        """Register a text; returns the canonical key it duplicates, or None if it is new."""
+        signature = self.signature(text)
+        candidates = []
+        for band, band_hash in self._bands(signature):
+            candidates.extend(self.buckets[band].get(band_hash, ()))
+
+        best, best_similarity = None, self.threshold
+        for candidate in dict.fromkeys(candidates):
+            similarity = float(np.mean(self.signatures[candidate] == signature))
+            if similarity >= best_similarity:
+                best, best_similarity = candidate, similarity
+        if best is not None:
+            return best
+
+        self.signatures[key] = signature
+        for band, band_hash in self._bands(signature):
+            self.buckets[band].setdefault(band_hash, []).append(key)
+        return None
+
+
+def dedup_chunks(chunks: dict, threshold: float = 0.8, **options):
+    """
+    Collapse near-duplicate chunks in a {chunk_id: chunk} dict (in stream order).
+
+    Returns (canonical, aliases, report): the chunks to embed, {canonical id:
+    [alias ids]}, and how many embeddings and bytes the collapse saved.
+    """
+    dedup = Deduplicator(threshold=threshold, **options)
+    canonical, aliases = {}, {}
+    text_bytes_saved = 0
+    for cid, chunk in chunks.items():
+        original = dedup.add(cid, chunk["content"])
+        if original is None:
+            canonical[cid] = chunk
+        else:
+            aliases.setdefault(original, []).append(cid)
+            text_bytes_saved += len(chunk["content"].encode("utf-8"))
+
+    saved = len(chunks) - len(canonical)
+    report = {
+        "chunks": len(chunks),
+        "canonical": len(canonical),
+        "embeddings_saved": saved,
+        "text_bytes_saved": text_bytes_saved,
+        "vector_bytes_saved": saved * EMBEDDING_BYTES,
+    }
+    return canonical, aliases, report
+
+
+def print_report(report: dict):
+    share = report["embeddings_saved"] / report["chunks"] if report["chunks"] else 0.0
+    print(f"🧹 Dedup: {report['chunks']} chunks -> {report['canonical']} canonical; "
+          f"saved {report['embeddings_saved']} embeddings ({share:.1%}), "
+          f"{report['text_bytes_saved'] / 1024:.1f} KiB text, {report['vector_bytes_saved'] / 1024:.1f} KiB vectors")
+
+
+if __name__ == "__main__":
+    from indexing import chunk_id, iter_chunks
+
+    parser = argparse.ArgumentParser(description="Report near-duplicate chunks in a convert-md.py chunk file.")
+    parser.add_argument("path")
+    parser.add_argument("--threshold", type=float, default=0.8, help="Estimated Jaccard similarity counted as a duplicate")
+    parser.add_argument("--show", type=int, default=5, help="Print this many duplicate groups")
+    args = parser.parse_args()
+
+    chunks = {}
+    for chunk in iter_chunks(args.path):
+        if chunk.get("content"):
+            chunks.setdefault(chunk_id(chunk), chunk)
+    canonical, aliases, report = dedup_chunks(chunks, threshold=args.threshold)
+    print_report(report)
+    for cid, alias_ids in sorted(aliases.items(), key=lambda item: -len(item[1]))[:args.show]:
+        print(f"\n[{len(alias_ids)} aliases] {canonical[cid]['content'][:120]!r}")
+        for alias in alias_ids[:3]:
+            print(f"   ~ {chunks[alias]['content'][:120]!r}")
@@ -0,0 +1,161 @@
+import argparse
+import json
+import mmap
+import os
+from collections.abc import Mapping
+
+import numpy as np
+
+from indexing import chunk_id
+
+
+class DocumentStore(Mapping):
+    """
+    Read-only {doc_id: record} view of a BEIR corpus.jsonl or convert-md.py chunk file.
+
+    A one-off pass writes an offset index next to the file: the ids as a sorted
+    fixed-width byte array and each record's (offset, length) in the same order.
+    Both arrays and the source file are memory-mapped, so a lookup is a binary
+    search plus one json.loads of the record's bytes and memory stays flat
+    however large the corpus is. The index is rebuilt when the file changes.
+
+    Ids are the BEIR `_id` for corpus records and the content-hash chunk id for
+    chunks, the same ids the dense collection keeps in metadata['_id'].
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.ids_path = path + ".ids.npy"
+        self.offsets_path = path + ".offsets.npy"
+        self.meta_path = path + ".idx.json"
+        if not self._index_is_current():
+            self.build()
+        self.ids = np.load(self.ids_path, mmap_mode="r")
+        self.offsets = np.load(self.offsets_path, mmap_mode="r")
+        self._file = open(path, "rb")
+        self.data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(path) else b""
+
+    def _source_state(self):
+        stat = os.stat(self.path)
+        return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    def _index_is_current(self) -> bool:
+        if not all(os.path.exists(p) for p in (self.ids_path, self.offsets_path, self.meta_path)):
+            return False
+        with open(self.meta_path, "r", encoding="utf-8") as f:
+            return json.load(f).get("source") == self._source_state()
+
+    def _scan(self):
+        """Yield (doc_id, offset, length) for every record in the source file."""
+        if self.path.lower().endswith(".json"):
+            # A JSON array: walk it with raw_decode, tracking byte offsets of each element
+            with open(self.path, "r", encoding="utf-8") as f:
+                text = f.read()
+            decoder = json.JSONDecoder()
+            position = text.index("[") + 1
+            byte_position = len(text[:position].encode("utf-8"))
+            while True:
+                while position < len(text) and text[position] in " \t\r\n,":
+                    byte_position += 1  # separators are ASCII
+                    position += 1
+                if position >= len(text) or text[position] == "]":
+                    return
+                record, end = decoder.raw_decode(text, position)
+                length = len(text[position:end].encode("utf-8"))
+                if record.get("content"):
+                    yield chunk_id(record), byte_position, length
+                byte_position += length
+                position = end
+        else:
+            with open(self.path, "rb") as f:
+                offset = 0
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        doc_id = chunk_id(record) if "content" in record else record["_id"]
+                        yield doc_id, offset, len(line)
+                    offset += len(line)
+
+    def build(self):
+        """Scan the source once and write the sorted id and offset arrays."""
+        ids, offsets = [], []
+        for doc_id, offset, length in self._scan():
+            ids.append(str(doc_id).encode("utf-8"))
+            offsets.append((offset, length))
+        width = max((len(doc_id) for doc_id in ids), default=1)
+        ids = np.array(ids, dtype=f"S{width}")
+        offsets = np.array(offsets, dtype=np.int64).reshape(-1, 2)
+        order = np.argsort(ids, kind="stable")
+        ids, offsets = ids[order], offsets[order]
+        # Repeated ids (identical chunks) resolve to their first occurrence
+        first = np.ones(len(ids), dtype=bool)
+        first[1:] = ids[1:] != ids[:-1]
+        np.save(self.ids_path, ids[first])
+        np.save(self.offsets_path, offsets[first])
+        with open(self.meta_path, "w", encoding="utf-8") as f:
+            json.dump({"source": self._source_state(), "count": int(first.sum())}, f)
+        print(f"🗂️ Indexed {int(first.sum())} records of '{self.path}'")
+
+    def _rows(self, doc_ids):
+        """Row of each id in the sorted arrays, or -1 when absent."""
+        if not len(self.ids):
+            return np.full(len(doc_ids), -1)
+        encoded = [str(doc_id).encode("utf-8") for doc_id in doc_ids]
+        keys = np.array(encoded, dtype=self.ids.dtype)
+        fits = np.array([len(key) <= self.ids.dtype.itemsize for key in encoded], dtype=bool)
+        rows = np.minimum(np.searchsorted(self.ids, keys), len(self.ids) - 1)
+        return np.where((self.ids[rows] == keys) & fits, rows, -1)
+
+    def _read(self, row: int) -> dict:
+        offset, length = self.offsets[row]
+        return json.loads(self.data[offset:offset + length])
+
+    def __getitem__(self, doc_id) -> dict:
+        row = self._rows([doc_id])[0]
+        if row < 0:
+            raise KeyError(doc_id)
+        return self._read(row)
+
+    def get_many(self, doc_ids) -> list:
+        """Records for many ids, None for unknown ids; reads in file order for locality."""
+        rows = self._rows(list(doc_ids))
+        records = [None] * len(rows)
+        for i in sorted(np.flatnonzero(rows >= 0), key=lambda i: self.offsets[rows[i]][0]):
+            records[i] = self._read(rows[i])
+        return records
+
+    @staticmethod
+    def text(record: dict):
+        """Passage text of a record: `text` for corpus records, `content` for chunks."""
+        if record is None:
+            return None
+        return record.get("text") or record.get("content")
+
+    def __contains__(self, doc_id) -> bool:
+        return self._rows([doc_id])[0] >= 0
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        for doc_id in self.ids:
+            yield doc_id.decode("utf-8")
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the offset index of a corpus.jsonl or chunk file.")
+    parser.add_argument("path")
+    args = parser.parse_args()
+    with DocumentStore(args.path) as store:
+        print(f"✅ {len(store)} records available by id")
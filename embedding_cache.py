@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+EMBEDDING_CACHE_DIR = "embedding_cache"
+
+
+class EmbeddingCache:
+    """
+    On-disk, content-addressed cache of embedding vectors.
+
+    Vectors live in a memory-mapped float32 file (one row per entry) and an index
+    maps each key to its row. Keys hash the model name, task and text, so a cache
+    directory can be shared by every script that embeds with the same model.
+    Once the file reaches max_bytes, the least recently used rows are reused.
+    Every row also records its own key, so rows reused after the index was last
+    flushed are detected on load and dropped instead of returning a wrong vector.
+    """
+
+    VECTORS_FILE = "vectors.f32"
+    KEYS_FILE = "keys.bin"
+    INDEX_FILE = "index.json"
+    KEY_BYTES = 32
+
+    def __init__(self, directory: str = EMBEDDING_CACHE_DIR, dim: int = 1024, max_bytes: int = 2 * 1024 ** 3, grow_rows: int = 4096):
+        self.directory = directory
+        self.dim = dim
+        self.max_rows = max(1, max_bytes // (dim * 4))
+        self.grow_rows = grow_rows
+        self.index = OrderedDict()  # key -> row, least recently used first
+        self.vectors = None
+        self.row_keys = None
+        self.capacity = 0
+        self.next_row = 0
+        self.free_rows = []
+        self.hits = 0
+        self.misses = 0
+        self._dirty = False
+
+        os.makedirs(directory, exist_ok=True)
+        self.vectors_path = os.path.join(directory, self.VECTORS_FILE)
+        self.keys_path = os.path.join(directory, self.KEYS_FILE)
+        self.index_path = os.path.join(directory, self.INDEX_FILE)
+        self._load()
+
+    @staticmethod
+    def key(model_name: str, task: str, text: str) -> str:
+        return hashlib.blake2b(f"{model_name}\0{task}\0{text}".encode("utf-8"), digest_size=16).hexdigest()
+
+    def _load(self):
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            if state.get("dim") == self.dim:
+                self.index = OrderedDict(state["entries"])
+            else:
+                print(f"⚠️ Embedding cache at '{self.directory}' has dim {state.get('dim')}, expected {self.dim}; starting empty.")
+
+        rows = 0
+        if os.path.exists(self.vectors_path) and os.path.exists(self.keys_path):
+            rows = min(os.path.getsize(self.vectors_path) // (self.dim * 4), os.path.getsize(self.keys_path) // self.KEY_BYTES)
+        self._resize(max(rows, min(self.grow_rows, self.max_rows)))
+
+        # Keep only entries whose row still holds the vector written for that key
+        self.index = OrderedDict(
+            (key, row) for key, row in self.index.items()
+            if row < rows and self.row_keys[row] == key.encode("ascii")
+        )
+        used = set(self.index.values())
+        self.next_row = max(used) + 1 if used else 0
+        self.free_rows = [row for row in range(self.next_row) if row not in used]
+
+    def _resize(self, rows: int):
+        if self.vectors is not None:
+            self.vectors.flush()
+            self.row_keys.flush()
+            self.vectors = self.row_keys = None
+        with open(self.vectors_path, "ab") as f:
+            f.truncate(rows * self.dim * 4)
+        with open(self.keys_path, "ab") as f:
+            f.truncate(rows * self.KEY_BYTES)
+        self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(rows, self.dim))
+        self.row_keys = np.memmap(self.keys_path, dtype=f"S{self.KEY_BYTES}", mode="r+", shape=(rows,))
+        self.capacity = rows
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, key: str):
+        return key in self.index
+
+    def get(self, key: str):
+        """Return a copy of the cached vector, or None on a miss."""
+        row = self.index.get(key)
+        if row is None:
+            self.misses += 1
+            return None
+        self.index.move_to_end(key)
+        self.hits += 1
+        return np.array(self.vectors[row])
+
+    def put(self, key: str, vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        if vector.shape != (self.dim,):
+            raise ValueError(f"Expected a vector of shape ({self.dim},), got {vector.shape}")
+
+        if key in self.index:
+            row = self.index[key]
+            self.index.move_to_end(key)
+        elif self.free_rows:
+            row = self.free_rows.pop()
+            self.index[key] = row
+        elif self.next_row < self.max_rows:
+            row = self.next_row
+            self.next_row += 1
+            if row >= self.capacity:
+                self._resize(min(self.capacity + self.grow_rows, self.max_rows))
+            self.index[key] = row
+        else:
+            _, row = self.index.popitem(last=False)
+            self.index[key] = row
+
+        self.vectors[row] = vector
+        self.row_keys[row] = key.encode("ascii")
+        self._dirty = True
+
+    def flush(self):
+        """Persist vectors, then the index, so the index never points past the data."""
+        if not self._dirty:
+            return
+        self.vectors.flush()
+        self.row_keys.flush()
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "entries": list(self.index.items())}, f)
+        os.replace(tmp_path, self.index_path)
+        self._dirty = False
+
+    def close(self):
+        self.flush()
+        self.vectors = self.row_keys = None
+
+    def stats(self):
+        return {"entries": len(self.index), "hits": self.hits, "misses": self.misses, "bytes": self.capacity * self.dim * 4}
@@ -0,0 +1,45 @@
+import numpy as np
+
+try:
+    import msgpack
+except ImportError:  # msgpack framing is optional
+    msgpack = None
+
+JSON_MEDIA_TYPE = "application/json"
+BINARY_MEDIA_TYPE = "application/octet-stream"
+MSGPACK_MEDIA_TYPE = "application/x-msgpack"
+
+# Little-endian wire dtypes understood by the embedding service
+DTYPES = {"float32": "<f4", "float16": "<f2"}
+RESPONSE_FORMATS = ("json", "float32", "float16", "msgpack")
+
+
+def request_headers(response_format: str) -> dict:
+    """Headers asking the embedding service for the given response format."""
+    if response_format not in RESPONSE_FORMATS:
+        raise ValueError(f"Unknown response format '{response_format}'")
+    if response_format == "json":
+        return {}
+    if response_format == "msgpack":
+        if msgpack is None:
+            raise ImportError("Install msgpack to use the msgpack response format: pip install msgpack")
+        return {"Accept": MSGPACK_MEDIA_TYPE, "X-Embedding-Dtype": "float32"}
+    return {"Accept": BINARY_MEDIA_TYPE, "X-Embedding-Dtype": response_format}
+
+
+def decode_embeddings(body: bytes, content_type: str, headers) -> np.ndarray:
+    """Decode a binary or msgpack embedding response into a float32 (n, dim) array."""
+    if content_type == MSGPACK_MEDIA_TYPE:
+        if msgpack is None:
+            raise ImportError("Install msgpack to decode msgpack responses: pip install msgpack")
+        frame = msgpack.unpackb(body)
+        dtype, shape, data = frame["dtype"], frame["shape"], frame["data"]
+    elif content_type == BINARY_MEDIA_TYPE:
+        dtype = headers["X-Embedding-Dtype"]
+        shape = [int(part) for part in headers["X-Embedding-Shape"].split(",")]
+        data = body
+    else:
+        raise ValueError(f"Unexpected embedding response type '{content_type}'")
+
+    array = np.frombuffer(data, dtype=DTYPES[dtype]).reshape(shape)
+    return array if array.dtype == np.float32 else array.astype(np.float32)
@@ -1,8 +1,17 @@
 from beir import util, LoggingHandler
-from beir.datasets.data_loader import GenericDataLoader
 from beir.retrieval.evaluation import EvaluateRetrieval
-from chroma_retriever import ChromaRetriever
+from bm25 import BM25Index, BM25_INDEX_DIR, source_state
+from chroma_retriever import ChromaRetriever, HybridRetriever
+from doc_store import DocumentStore
+from embedding_cache import EmbeddingCache, EMBEDDING_CACHE_DIR
+from local_index import LOCAL_INDEX_DIR
+from tracing import JsonlTracer
+import argparse
 import asyncio
+import csv
+import json
+import os
+import time
 
 SCIFACT_COLLECTION_NAME = "scifact_collection"
 SCIFACT_DATA_PATH = r"D:\project\dense_retrieval_rag\datasets\scifact"
@@ -10,52 +19,289 @@ SCIFACT_DATA_PATH = r"D:\project\dense_retrieval_rag\datasets\scifact"
 SCIDOCS_COLLECTION_NAME = "scidocs_collection"
 SCIDOCS_DATA_PATH = r"D:\project\dense_retrieval_rag\datasets\scidocs"
 
+K_VALUES = [1, 3, 5, 10]
+RETRIEVAL_MODES = ["sparse", "dense", "hybrid"]
 
-async def evaluate_chroma_retriever():
+
+def load_dataset(data_path: str, split: str = "test"):
+    """
+    BEIR (corpus, queries, qrels) without reading the corpus into memory.
+
+    The corpus is a memory-mapped DocumentStore over corpus.jsonl; queries are
+    limited to those with qrels for the split, as GenericDataLoader does.
+    """
+    qrels = {}
+    with open(os.path.join(data_path, "qrels", f"{split}.tsv"), "r", encoding="utf-8") as f:
+        reader = csv.reader(f, delimiter="\t")
+        next(reader)  # header
+        for query_id, corpus_id, score in reader:
+            qrels.setdefault(query_id, {})[corpus_id] = int(score)
+
+    queries = {}
+    with open(os.path.join(data_path, "queries.jsonl"), "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                query = json.loads(line)
+                if query["_id"] in qrels:
+                    queries[query["_id"]] = query["text"]
+
+    return DocumentStore(os.path.join(data_path, "corpus.jsonl")), queries, qrels
+
+
+def print_metrics(ndcg, _map, recall, precision):
+    print("\n" + "="*50)
+    print("EVALUATION RESULTS")
+    print("="*50)
+    print("\nNDCG@k:")
+    for k, v in ndcg.items():
+        print(f"  {k}: {v:.4f}")
+
+    print("\nMAP@k:")
+    for k, v in _map.items():
+        print(f"  {k}: {v:.4f}")
+
+    print("\nRecall@k:")
+    for k, v in recall.items():
+        print(f"  {k}: {v:.4f}")
+
+    print("\nPrecision@k:")
+    for k, v in precision.items():
+        print(f"  {k}: {v:.4f}")
+    print("="*50)
+
+
+def ann_recall(exact: dict, approximate: dict, k: int) -> float:
+    """Mean fraction of the exact top-k ids that the approximate search also returned."""
+    overlaps = []
+    for query_id, exact_scores in exact.items():
+        exact_top = sorted(exact_scores, key=exact_scores.get, reverse=True)[:k]
+        if not exact_top:
+            continue
+        approx_scores = approximate.get(query_id, {})
+        approx_top = set(sorted(approx_scores, key=approx_scores.get, reverse=True)[:k])
+        overlaps.append(len(approx_top.intersection(exact_top)) / len(exact_top))
+    return sum(overlaps) / len(overlaps) if overlaps else 0.0
+
+
+async def require_local_records(manager):
+    """Stop before an empty local index silently scores zero recall."""
+    if manager.backend == "local" and not await manager.collection.count():
+        raise RuntimeError(
+            f"Local index '{manager.collection_name}' in '{LOCAL_INDEX_DIR}' is empty. Build it with "
+            f"'python indexing.py --backend local ingest --dataset scidocs', or copy the Chroma collection without "
+            f"re-embedding: 'python snapshot.py export {manager.collection_name} <dir>' then "
+            f"'python snapshot.py import {manager.collection_name} <dir> --backend local'."
+        )
+
+
+async def run_retriever(retriever: ChromaRetriever, corpus, queries, top_k: int = 10):
+    await retriever.connect()
+    try:
+        await require_local_records(retriever.manager)
+        return await retriever.retrieve(corpus=corpus, queries=queries, top_k=top_k)
+    finally:
+        await retriever.disconnect()
+
+
+def print_trace_summary(tracer: JsonlTracer):
+    print("\n⏱️ Time per stage (client spans; see the embedding service's /metrics for tokenize/forward):")
+    for name, stats in tracer.summary().items():
+        print(f"  {name:<9} {stats['count']:7d} spans  {stats['total_ms'] / 1000:9.2f} s total  {stats['mean_ms']:8.2f} ms mean")
+
+
+async def evaluate_chroma_retriever(
+    backend: str = "chroma",
+    check_ann_recall: bool = False,
+    trace_path: str = None,
+    trace_sample_rate: float = 1.0,
+    num_shards: int = 1,
+    hosts: list[str] = None,
+    embed_urls: list[str] = None,
+):
     """Evaluate ChromaDB retriever using BEIR framework."""
     # Load dataset
-    corpus, queries, qrels = GenericDataLoader(data_folder=SCIDOCS_DATA_PATH).load(split="test")
-    
+    corpus, queries, qrels = load_dataset(SCIDOCS_DATA_PATH, split="test")
+
     print(f"📊 Loaded {len(corpus)} documents, {len(queries)} queries, {len(qrels)} qrels")
-    
-    # Initialize ChromaDB retriever
-    retriever = ChromaRetriever(collection_name=SCIDOCS_COLLECTION_NAME)
-    await retriever.connect()
-    
+
+    cache = EmbeddingCache(EMBEDDING_CACHE_DIR)
+
+    exact_retriever = None
+    if check_ann_recall and backend != "local":
+        # Exact in-process search over the same vectors is the ground truth for the ANN index;
+        # open it first so an empty local index fails before the Chroma run rather than after
+        exact_retriever = ChromaRetriever(collection_name=SCIDOCS_COLLECTION_NAME, cache=cache, backend="local")
+        await exact_retriever.connect()
+        try:
+            await require_local_records(exact_retriever.manager)
+        except RuntimeError:
+            await exact_retriever.disconnect()
+            raise
+
+    # Initialize ChromaDB retriever, optionally tracing every stage to a JSONL file
+    tracer = JsonlTracer(trace_path, sample_rate=trace_sample_rate) if trace_path else None
+    retriever = ChromaRetriever(
+        collection_name=SCIDOCS_COLLECTION_NAME, cache=cache, backend=backend, tracer=tracer,
+        num_shards=num_shards, hosts=hosts, embed_urls=embed_urls,
+    )
+
+    # Retrieve documents
+    print(f"🔍 Retrieving documents ({backend} backend)...")
+    results = await run_retriever(retriever, corpus, queries, top_k=max(K_VALUES))
+
+    # Evaluate using BEIR
+    print("📈 Evaluating results...")
+    evaluator = EvaluateRetrieval()
+    ndcg, _map, recall, precision = evaluator.evaluate(qrels, results, k_values=K_VALUES)
+    print_metrics(ndcg, _map, recall, precision)
+    if tracer is not None:
+        print_trace_summary(tracer)
+
+    if exact_retriever is not None:
+        print("🎯 Running exact local search for ANN recall...")
+        try:
+            exact_results = await exact_retriever.retrieve(corpus=corpus, queries=queries, top_k=max(K_VALUES))
+        finally:
+            await exact_retriever.disconnect()
+        print("\nANN recall vs exact search:")
+        for k in K_VALUES:
+            print(f"  Recall@{k}: {ann_recall(exact_results, results, k):.4f}")
+
+
+def load_bm25(corpus_path: str, directory: str = BM25_INDEX_DIR) -> BM25Index:
+    """Memory-map a saved BM25 index, (re)building it from the BEIR corpus if missing or built from another file."""
+    if os.path.exists(os.path.join(directory, "vocab.json")):
+        index = BM25Index.load(directory)
+        if index.source == source_state(corpus_path):
+            return index
+        print(f"♻️ BM25 index in '{directory}' was built from another corpus version, rebuilding...")
+    else:
+        print(f"🔨 Building BM25 index into '{directory}'...")
+    index = BM25Index.from_path(corpus_path)
+    index.save(directory)
+    return index
+
+
+async def evaluate_retrieval_modes(
+    modes,
+    backend: str = "chroma",
+    bm25_dir: str = BM25_INDEX_DIR,
+    num_shards: int = 1,
+    hosts: list[str] = None,
+    embed_urls: list[str] = None,
+):
+    """Score sparse-only, dense-only and hybrid (RRF) retrieval side by side, with latencies."""
+    corpus, queries, qrels = load_dataset(SCIDOCS_DATA_PATH, split="test")
+    print(f"📊 Loaded {len(corpus)} documents, {len(queries)} queries, {len(qrels)} qrels")
+
+    bm25 = load_bm25(corpus.path, bm25_dir) if {"sparse", "hybrid"}.intersection(modes) else None
+    evaluator = EvaluateRetrieval()
+    top_k = max(K_VALUES)
+
+    topology = {"num_shards": num_shards, "hosts": hosts, "embed_urls": embed_urls}
+
+    # No embedding cache: every dense-backed mode embeds its own queries, so an
+    # earlier mode cannot warm a later one. Only retrieve() is timed; connecting
+    # and disconnecting stay outside so the latencies compare retrieval alone.
+    rows = []
+    for mode in modes:
+        print(f"🔍 Retrieving ({mode})...")
+        if mode == "sparse":
+            start = time.perf_counter()
+            results = bm25.retrieve(queries, top_k=top_k)
+            elapsed = time.perf_counter() - start
+        else:
+            if mode == "dense":
+                retriever = ChromaRetriever(collection_name=SCIDOCS_COLLECTION_NAME, cache=None, backend=backend, **topology)
+            else:
+                retriever = HybridRetriever(SCIDOCS_COLLECTION_NAME, bm25, cache=None, backend=backend, **topology)
+            await retriever.connect()
+            try:
+                await require_local_records(retriever.manager)
+                start = time.perf_counter()
+                results = await retriever.retrieve(corpus=corpus, queries=queries, top_k=top_k)
+                elapsed = time.perf_counter() - start
+            finally:
+                await retriever.disconnect()
+        ndcg, _map, recall, precision = evaluator.evaluate(qrels, results, k_values=K_VALUES)
+        rows.append((mode, ndcg[f"NDCG@{top_k}"], recall[f"Recall@{top_k}"], elapsed))
+
+    print(f"\n{'mode':<8} {f'NDCG@{top_k}':>9} {f'Recall@{top_k}':>10} {'total s':>9} {'ms/query':>9}")
+    for mode, ndcg_k, recall_k, elapsed in rows:
+        print(f"{mode:<8} {ndcg_k:9.4f} {recall_k:10.4f} {elapsed:9.2f} {1000 * elapsed / max(len(queries), 1):9.2f}")
+
+
+async def evaluate_quantization(quantization: str, truncate_dim: int = None, rescore_multiplier: int = 4):
+    """
+    Compare a quantized local index with exact local search: memory saved and recall lost.
+
+    Needs the SciDocs collection in the local index, see require_local_records.
+    """
+    corpus, queries, qrels = load_dataset(SCIDOCS_DATA_PATH, split="test")
+    print(f"📊 Loaded {len(corpus)} documents, {len(queries)} queries, {len(qrels)} qrels")
+
+    cache = EmbeddingCache(EMBEDDING_CACHE_DIR)
+    evaluator = EvaluateRetrieval()
+
+    exact_retriever = ChromaRetriever(collection_name=SCIDOCS_COLLECTION_NAME, cache=cache, backend="local")
+    exact_results = await run_retriever(exact_retriever, corpus, queries, top_k=max(K_VALUES))
+    _, _, exact_recall, _ = evaluator.evaluate(qrels, exact_results, k_values=K_VALUES)
+
+    index_options = {"quantization": quantization, "truncate_dim": truncate_dim, "rescore_multiplier": rescore_multiplier}
+    quantized_retriever = ChromaRetriever(collection_name=SCIDOCS_COLLECTION_NAME, cache=cache, backend="local", index_options=index_options)
+    await quantized_retriever.connect()
     try:
-        # Retrieve documents
-        print("🔍 Retrieving documents from ChromaDB...")
-        results = await retriever.retrieve(corpus=corpus, queries=queries, top_k=10)
-        
-        # Evaluate using BEIR
-        print("📈 Evaluating results...")
-        evaluator = EvaluateRetrieval()
-        ndcg, _map, recall, precision = evaluator.evaluate(qrels, results, k_values=[1, 3, 5, 10])
-        
-        print("\n" + "="*50)
-        print("EVALUATION RESULTS")
-        print("="*50)
-        print("\nNDCG@k:")
-        for k, v in ndcg.items():
-            print(f"  {k}: {v:.4f}")
-        
-        print("\nMAP@k:")
-        for k, v in _map.items():
-            print(f"  {k}: {v:.4f}")
-        
-        print("\nRecall@k:")
-        for k, v in recall.items():
-            print(f"  {k}: {v:.4f}")
-        
-        print("\nPrecision@k:")
-        for k, v in precision.items():
-            print(f"  {k}: {v:.4f}")
-        print("="*50)
-        
+        await require_local_records(quantized_retriever.manager)
+        quantized_results = await quantized_retriever.retrieve(corpus=corpus, queries=queries, top_k=max(K_VALUES))
+        memory = quantized_retriever.manager.collection.memory_report()
     finally:
-        await retriever.disconnect()
+        await quantized_retriever.disconnect()
+
+    ndcg, _map, recall, precision = evaluator.evaluate(qrels, quantized_results, k_values=K_VALUES)
+    print_metrics(ndcg, _map, recall, precision)
+
+    print(f"\n💾 First-pass memory ({quantization}, dim={truncate_dim or 'full'}): "
+          f"{memory['first_pass_bytes'] / 2**20:.1f} MiB vs {memory['full_bytes'] / 2**20:.1f} MiB full precision "
+          f"({memory['compression']:.1f}x smaller, {memory['saved_bytes'] / 2**20:.1f} MiB saved)")
+    print("\nRecall@k lost vs exact float32 search:")
+    for k in K_VALUES:
+        key = f"Recall@{k}"
+        print(f"  {key}: {recall[key]:.4f} (exact {exact_recall[key]:.4f}, Δ {recall[key] - exact_recall[key]:+.4f}), "
+              f"top-{k} overlap {ann_recall(exact_results, quantized_results, k):.4f}")
 
 
 if __name__ == "__main__":
-    # Evaluate ChromaDB retriever
-    asyncio.run(evaluate_chroma_retriever())
+    parser = argparse.ArgumentParser(
+        description="Evaluate dense retrieval on a BEIR dataset.",
+        epilog="The local backend, --ann-recall and --quantization search local_index/scidocs_collection. Build it with "
+               "'python indexing.py --backend local ingest --dataset scidocs' or restore a snapshot of the Chroma collection "
+               "with 'python snapshot.py import scidocs_collection <dir> --backend local'.",
+    )
+    parser.add_argument("--backend", choices=["chroma", "local"], default="chroma", help="Vector index to query")
+    parser.add_argument("--ann-recall", action="store_true", help="Compare Chroma's ANN results with exact local search (needs the local index)")
+    parser.add_argument("--quantization", choices=["int8", "binary"], help="Evaluate a quantized local index against exact search (needs the local index)")
+    parser.add_argument("--truncate-dim", type=int, help="Matryoshka dimension used for the quantized first pass")
+    parser.add_argument("--rescore-multiplier", type=int, default=4, help="Candidates rescored in full precision, as a multiple of k")
+    parser.add_argument("--modes", nargs="+", choices=RETRIEVAL_MODES, help="Compare sparse (BM25), dense and hybrid retrieval")
+    parser.add_argument("--bm25-dir", default=BM25_INDEX_DIR, help="Saved BM25 index; built from the corpus if missing")
+    parser.add_argument("--shards", type=int, default=1, help="Query a collection split into this many shards")
+    parser.add_argument("--hosts", nargs="+", help="Chroma servers the shards are spread over")
+    parser.add_argument("--embed-urls", nargs="+", help="Embedding service replicas to route queries over")
+    parser.add_argument("--trace", help="Write per-stage client spans of the dense run to this JSONL file")
+    parser.add_argument("--trace-sample-rate", type=float, default=1.0, help="Fraction of query batches whose spans are written")
+    args = parser.parse_args()
+
+    if args.quantization:
+        asyncio.run(evaluate_quantization(args.quantization, args.truncate_dim, args.rescore_multiplier))
+    elif args.modes:
+        asyncio.run(evaluate_retrieval_modes(
+            args.modes, backend=args.backend, bm25_dir=args.bm25_dir,
+            num_shards=args.shards, hosts=args.hosts, embed_urls=args.embed_urls,
+        ))
+    else:
+        # Evaluate ChromaDB retriever
+        asyncio.run(evaluate_chroma_retriever(
+            backend=args.backend, check_ann_recall=args.ann_recall,
+            trace_path=args.trace, trace_sample_rate=args.trace_sample_rate,
+            num_shards=args.shards, hosts=args.hosts, embed_urls=args.embed_urls,
+        ))
@@ -1,5 +1,9 @@
-import json, uuid, asyncio
+import argparse, json, hashlib, asyncio
+from collections import deque
 from base import ChromaManager
+from checkpoint import Checkpoint
+from embedding_cache import EmbeddingCache, EMBEDDING_CACHE_DIR
+from dedup import dedup_chunks, print_report
 
 SCIFACT_COLLECTION_NAME = "scifact_collection"
 SCIFACT_COLLECTION_PATH = r"D:\project\dense_retrieval_rag\datasets\scifact\corpus.jsonl"
@@ -7,68 +11,303 @@ SCIFACT_COLLECTION_PATH = r"D:\project\dense_retrieval_rag\datasets\scifact\corp
 SCIDOCS_COLLECTION_NAME = "scidocs_collection"
 SCIDOCS_COLLECTION_PATH = r"/home/product/datasets/scidocs/corpus.jsonl"
 
+NAGA_HILLS_COLLECTION_NAME = "1905_Naga_Hills_and_Manipur_by_Allen"
+NAGA_HILLS_CHUNKS_PATH = "1905 Naga Hills and Manipur by Allen s.jsonl"  # convert-md.py output
+
+BATCH_SIZE = 64
+QUEUE_SIZE = 4  # batches buffered between pipeline stages
+STREAM_WINDOW = 1024  # records in flight on an /embed/stream request
+
+DATASETS = {
+    "scifact": (SCIFACT_COLLECTION_NAME, SCIFACT_COLLECTION_PATH),
+    "scidocs": (SCIDOCS_COLLECTION_NAME, SCIDOCS_COLLECTION_PATH),
+}
+
+
+def content_id(*parts) -> str:
+    """Deterministic id from the content it identifies; unchanged content keeps its id."""
+    return hashlib.sha256("\0".join(str(part) for part in parts).encode("utf-8")).hexdigest()[:32]
+
+
+def chunk_id(chunk: dict) -> str:
+    return content_id(chunk.get("title", ""), chunk.get("content", ""))
+
 
 class Document:
     def __init__(self, doc: dict):
-        self.ids = [str(uuid.uuid4())]
+        self.ids = [content_id(doc.get("_id", ""), doc.get("title", ""), doc.get("text", ""))]
         self.documents = [doc.get("text", "")]
         self.meta_datas = [{"_id": doc.get("_id", ""), "title": doc.get("title", ""), "metadata": json.dumps(doc.get("metadata", {}))}]
 
 
-async def load_corpus_and_index(path, manager):
-    count = 0
+async def _resume_checkpoint(manager: ChromaManager, path, resume: bool) -> Checkpoint:
+    """Load the ingest checkpoint, discarding it if the collection no longer holds what it records."""
+    checkpoint = Checkpoint(manager.collection_name, path)
+    if not resume:
+        return checkpoint
+    checkpoint.load()
+    if checkpoint.line:
+        count = await manager.collection.count()
+        if count < checkpoint.indexed:
+            print(f"⚠️ Checkpoint for '{manager.collection_name}' records {checkpoint.indexed} documents but the collection holds {count}; starting over")
+            checkpoint.clear()
+        else:
+            print(f"⏩ Resuming '{manager.collection_name}' after line {checkpoint.line} ({checkpoint.indexed} documents already indexed)")
+    return checkpoint
+
+
+async def _read_stage(path, start_line: int, batch_size: int, out_queue: asyncio.Queue):
+    """Parse corpus lines after start_line into batches of Documents."""
+    batch, line_no = [], start_line
     with open(path, "r", encoding="utf-8") as f:
-        for line in f:
+        for line_no, line in enumerate(f, start=1):
+            if line_no <= start_line:
+                continue
             line = line.strip()
             if not line:
                 continue
 
             doc = json.loads(line)
             if doc.get("text", None):
-                document = Document(doc)
+                batch.append(Document(doc))
 
-                await manager.create(
-                    ids=document.ids,
-                    documents=document.documents,
-                    metadatas=document.meta_datas,
-                )
-                count += 1
-                print(f"Indexed document ID: {document.ids[0]}, counter: {count}")
+            if len(batch) >= batch_size:
+                await out_queue.put((line_no, batch))
+                batch = []
 
+    # Always emit a final item so the checkpoint covers trailing lines without text
+    await out_queue.put((line_no, batch))
+    await out_queue.put(None)
 
-async def main():
-    manager = ChromaManager(collection_name=SCIFACT_COLLECTION_NAME)
 
-    await manager.connect()
-    
-    # await manager.delete_collection()
-    await load_corpus_and_index(SCIFACT_COLLECTION_PATH, manager)
+async def _embed_stage(manager: ChromaManager, in_queue: asyncio.Queue, out_queue: asyncio.Queue):
+    while (item := await in_queue.get()) is not None:
+        line_no, batch = item
+        texts = [document.documents[0] for document in batch]
+        embeddings = await manager._get_embeddings(texts) if texts else []
+        await out_queue.put((line_no, batch, embeddings))
+    await out_queue.put(None)
+
+
+async def _write_stage(manager: ChromaManager, in_queue: asyncio.Queue, checkpoint: Checkpoint):
+    indexed = checkpoint.indexed
+    while (item := await in_queue.get()) is not None:
+        line_no, batch, embeddings = item
+        if batch:
+            # Upsert with deterministic ids keeps a resumed batch from creating duplicates
+            await manager.upsert(
+                ids=[document.ids[0] for document in batch],
+                documents=[document.documents[0] for document in batch],
+                metadatas=[document.meta_datas[0] for document in batch],
+                embeddings=embeddings,
+            )
+            indexed += len(batch)
+        if manager.cache is not None:
+            manager.cache.flush()
+        checkpoint.save(line_no, indexed)
+        print(f"Indexed {indexed} documents (line {line_no})")
+    return indexed
+
+
+async def load_corpus_and_index(path, manager, batch_size: int = BATCH_SIZE, queue_size: int = QUEUE_SIZE, resume: bool = True):
+    """
+    Stream a corpus.jsonl into the manager's collection.
+
+    Reading, embedding and writing run as overlapping stages joined by bounded
+    queues; each batch is written with one collection.upsert call and recorded in a
+    checkpoint so an interrupted ingest picks up where it stopped.
+    """
+    checkpoint = await _resume_checkpoint(manager, path, resume)
+
+    to_embed = asyncio.Queue(maxsize=queue_size)
+    to_write = asyncio.Queue(maxsize=queue_size)
+    tasks = [
+        asyncio.create_task(_read_stage(path, checkpoint.line, batch_size, to_embed)),
+        asyncio.create_task(_embed_stage(manager, to_embed, to_write)),
+        asyncio.create_task(_write_stage(manager, to_write, checkpoint)),
+    ]
+    try:
+        *_, indexed = await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+    checkpoint.clear()
+    print(f"✅ Indexed {indexed} documents into '{manager.collection_name}'")
+    return indexed
+
 
-    await manager.disconnect()
+async def stream_corpus_and_index(path, manager, batch_size: int = BATCH_SIZE, window: int = STREAM_WINDOW, resume: bool = True):
+    """
+    Ingest a corpus.jsonl through one streaming /embed/stream request.
 
+    Documents are sent as NDJSON while their embeddings stream back in the same
+    order; finished embeddings are grouped into batches for the same checkpointed
+    writer stage used by load_corpus_and_index.
+    """
+    checkpoint = await _resume_checkpoint(manager, path, resume)
 
-# if __name__ == "__main__":
-#     asyncio.run(main())
+    in_flight = deque()  # (line_no, Document) in the order they were sent
+    last_line = checkpoint.line
+
+    async def records():
+        nonlocal last_line
+        with open(path, "r", encoding="utf-8") as f:
+            for line_no, line in enumerate(f, start=1):
+                if line_no <= checkpoint.line:
+                    continue
+                last_line = line_no
+                line = line.strip()
+                if not line:
+                    continue
+                doc = json.loads(line)
+                if doc.get("text", None):
+                    document = Document(doc)
+                    in_flight.append((line_no, document))
+                    yield document.ids[0], document.documents[0]
+
+    to_write = asyncio.Queue(maxsize=QUEUE_SIZE)
+    writer = asyncio.create_task(_write_stage(manager, to_write, checkpoint))
+    try:
+        batch, embeddings, line_no = [], [], checkpoint.line
+        async for record_id, embedding in manager.stream_embeddings(records(), window):
+            line_no, document = in_flight.popleft()
+            if document.ids[0] != record_id:
+                raise RuntimeError(f"Embedding stream out of order: expected {document.ids[0]}, got {record_id}")
+            manager._to_cache(document.documents[0], embedding)
+            batch.append(document)
+            embeddings.append(embedding)
+            if len(batch) >= batch_size:
+                await to_write.put((line_no, batch, embeddings))
+                batch, embeddings = [], []
+        await to_write.put((last_line, batch, embeddings))
+        await to_write.put(None)
+        indexed = await writer
+    except BaseException:
+        writer.cancel()
+        await asyncio.gather(writer, return_exceptions=True)
+        raise
+
+    checkpoint.clear()
+    print(f"✅ Indexed {indexed} documents into '{manager.collection_name}'")
+    return indexed
+
+
+def iter_chunks(path):
+    """Yield chunk dicts from convert-md.py output, either a .json array or .jsonl."""
+    with open(path, "r", encoding="utf-8") as f:
+        if path.lower().endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from json.load(f)
+
+
+async def sync_chunks(path, manager, batch_size: int = BATCH_SIZE, dedup_threshold: float = 0.8):
+    """
+    Bring a chunk collection in line with a chunk file, touching only what changed.
+
+    Chunk ids hash their title and content, so diffing the file's ids against the
+    ids already stored tells us exactly which chunks are new (embedded and
+    upserted) and which are gone (deleted in bulk); unchanged chunks are skipped.
+
+    Near-duplicate chunks (MinHash similarity >= dedup_threshold) are collapsed
+    into the first one seen before anything is embedded; its metadata lists the
+    alias ids and is rewritten in place, without re-embedding, when they change.
+    Pass dedup_threshold=None to store every chunk.
+    """
+    wanted = {}
+    for chunk in iter_chunks(path):
+        if chunk.get("content"):
+            wanted.setdefault(chunk_id(chunk), chunk)
+
+    aliases = {}
+    if dedup_threshold is not None:
+        wanted, aliases, report = dedup_chunks(wanted, threshold=dedup_threshold)
+        print_report(report)
+
+    def metadata(cid):
+        return {
+            "_id": cid,
+            "title": wanted[cid].get("title", ""),
+            "is_table": bool(wanted[cid].get("is_table", False)),
+            "aliases": json.dumps(aliases.get(cid, [])),
+        }
+
+    existing = await manager.get_metadatas()
+    to_add = [cid for cid in wanted if cid not in existing]
+    to_delete = [cid for cid in existing if cid not in wanted]
+    # A new or vanished near-duplicate changes a stored chunk's alias list but not its content
+    realiased = [
+        cid for cid in wanted
+        if cid in existing and json.loads((existing[cid] or {}).get("aliases", "[]")) != aliases.get(cid, [])
+    ]
+    print(f"🔄 '{manager.collection_name}': {len(wanted) - len(to_add)} unchanged ({len(realiased)} with new aliases), "
+          f"{len(to_add)} to embed, {len(to_delete)} to delete")
+
+    for start in range(0, len(to_add), batch_size):
+        batch = to_add[start:start + batch_size]
+        await manager.upsert(
+            ids=batch,
+            documents=[wanted[cid]["content"] for cid in batch],
+            metadatas=[metadata(cid) for cid in batch],
+        )
+        print(f"Indexed {min(start + batch_size, len(to_add))}/{len(to_add)} new chunks")
+
+    if realiased:
+        await manager.update_metadatas(realiased, [metadata(cid) for cid in realiased])
+    await manager.delete(to_delete)
+    print(f"✅ Synced '{manager.collection_name}' ({len(wanted)} chunks)")
+    return {
+        "added": len(to_add),
+        "deleted": len(to_delete),
+        "unchanged": len(wanted) - len(to_add),
+        "realiased": len(realiased),
+        "aliased": sum(len(alias_ids) for alias_ids in aliases.values()),
+    }
+
+
+async def main(args):
+    if args.command == "sync":
+        collection_name, path = args.collection or NAGA_HILLS_COLLECTION_NAME, args.path
+    else:
+        collection_name, path = DATASETS[args.dataset]
+        collection_name, path = args.collection or collection_name, args.corpus or path
+    manager = ChromaManager(collection_name=collection_name, cache=EmbeddingCache(EMBEDDING_CACHE_DIR), backend=args.backend)
+
+    await manager.connect()
+    try:
+        if args.command == "sync":
+            await sync_chunks(path, manager, args.batch_size, dedup_threshold=None if args.no_dedup else args.dedup_threshold)
+        elif args.stream:
+            await stream_corpus_and_index(path, manager, args.batch_size, window=args.window, resume=not args.no_resume)
+        else:
+            await load_corpus_and_index(path, manager, args.batch_size, resume=not args.no_resume)
+    finally:
+        await manager.disconnect()
 
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Embed a corpus or chunk file into a collection.")
+    parser.add_argument("--backend", choices=["chroma", "local"], default="chroma", help="Vector index to write to")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    commands = parser.add_subparsers(dest="command", required=True)
 
-# async def load_corpus_and_index(path, manager):
-#     count = 0
-#     with open(path, "r", encoding="utf-8") as f:
-#         for line in f:
-#             line = line.strip()
-#             if not line:
-#                 continue
+    ingest = commands.add_parser("ingest", help="Index a BEIR corpus.jsonl with checkpointed resume")
+    ingest.add_argument("--dataset", choices=sorted(DATASETS), default="scifact", help="Default collection name and corpus path")
+    ingest.add_argument("--corpus", help="corpus.jsonl to index instead of the dataset's default path")
+    ingest.add_argument("--collection", help="Collection to write instead of the dataset's default")
+    ingest.add_argument("--stream", action="store_true", help="Embed through one /embed/stream request instead of the batch pipeline")
+    ingest.add_argument("--window", type=int, default=STREAM_WINDOW, help="Records in flight with --stream")
+    ingest.add_argument("--no-resume", action="store_true", help="Ignore any checkpoint and start from the first line")
 
-#             if count >= 11313:
-#                 doc = json.loads(line)
-#                 if doc.get("text", None):
-#                     document = Document(doc)
+    sync = commands.add_parser("sync", help="Re-sync a convert-md.py chunk file, embedding only new chunks")
+    sync.add_argument("path", nargs="?", default=NAGA_HILLS_CHUNKS_PATH)
+    sync.add_argument("--collection", help=f"Collection to sync (default: {NAGA_HILLS_COLLECTION_NAME})")
+    sync.add_argument("--dedup-threshold", type=float, default=0.8, help="Estimated Jaccard similarity collapsed into one chunk")
+    sync.add_argument("--no-dedup", action="store_true", help="Store every chunk, even near-duplicates")
 
-#                     await manager.create(
-#                         ids=document.ids,
-#                         documents=document.documents,
-#                         metadatas=document.meta_datas,
-#                     )
-#             count += 1
-#             print(f"Counter: {count}")
\ No newline at end of file
+    asyncio.run(main(parser.parse_args()))
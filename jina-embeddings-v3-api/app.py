@@ -1,36 +1,264 @@
-from fastapi import FastAPI
+from concurrent.futures import Future
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from transformers import AutoTokenizer, AutoModel
+from inference import MODEL_NAME, PARITY_ATOL, WARMUP_LENGTHS, check_encode_parity, configure_threads, load_model, encode_tokenized, env_int, tokenize, warm_up
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, Registry, LATENCY_BUCKETS, BATCH_SIZE_BUCKETS, TOKEN_BUCKETS
+import asyncio
+import json
+import numpy as np
+import os
+import queue
+import threading
+import time
 import torch
 
+try:
+    import msgpack
+except ImportError:  # msgpack framing is optional
+    msgpack = None
+
 # ---------------------------
 # Model setup
 # ---------------------------
-model_name = "jinaai/jina-embeddings-v3"
-device = "cuda" if torch.cuda.is_available() else "cpu"
+model_name = MODEL_NAME
+device = os.getenv("DEVICE") or ("cuda" if torch.cuda.is_available() else "cpu")
+
+# Micro-batching: concurrent /embed calls are merged into one encode call
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "32"))
+MAX_WAIT_MS = float(os.getenv("MAX_WAIT_MS", "5"))
+
+# Streaming: NDJSON records are encoded in batches of this size, in input order
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", str(MAX_BATCH_SIZE)))
+MAX_STREAM_LINE_BYTES = int(os.getenv("MAX_STREAM_LINE_BYTES", str(1024 * 1024)))
+
+# CPU serving: QUANTIZATION=int8 quantizes the linear layers; thread pools are explicit
+QUANTIZATION = os.getenv("QUANTIZATION") or None
+LENGTH_BUCKETING = os.getenv("LENGTH_BUCKETING", "1") == "1"
+INTRA_OP_THREADS = env_int("TORCH_INTRA_OP_THREADS")
+INTER_OP_THREADS = env_int("TORCH_INTER_OP_THREADS")
+
+# Startup: MODEL_PATH is a local snapshot directory. The model's code lives in a separate
+# repo that must be in the HF cache (HF_HOME) for an offline start:
+#   huggingface-cli download jinaai/jina-embeddings-v3 --local-dir /models/jina-embeddings-v3
+#   huggingface-cli download jinaai/xlm-roberta-flash-implementation
+# Without the second download the code is fetched from the Hub at startup.
+MODEL_PATH = os.getenv("MODEL_PATH") or None
+WARMUP = [int(n) for n in os.getenv("WARMUP_LENGTHS", ",".join(map(str, WARMUP_LENGTHS))).split(",") if n.strip()]
+WARMUP_BATCH_SIZE = int(os.getenv("WARMUP_BATCH_SIZE", "8"))
+# Startup fails if the tokenize + encode_tokenized path disagrees with model.encode
+PARITY_TOLERANCE = float(os.getenv("PARITY_ATOL", str(PARITY_ATOL)))
+
+configure_threads(INTRA_OP_THREADS, INTER_OP_THREADS)
+
+# Loaded on a background thread so uvicorn binds its port immediately; requests get
+# 503 until the model is loaded and warmed up
+tokenizer, model = None, None
+startup = {"status": "loading", "error": None, "load_seconds": None, "warmup_seconds": None, "warmup_by_length": {}, "parity_max_diff": None}
+
+def load_and_warm_up():
+    global tokenizer, model
+    try:
+        print(f"🚀 Loading model '{MODEL_PATH or model_name}' on {device} (quantization: {QUANTIZATION or 'none'}) ...")
+        started = time.perf_counter()
+        loaded_tokenizer, loaded_model = load_model(model_name, device, QUANTIZATION, MODEL_PATH)
+        startup["load_seconds"] = time.perf_counter() - started
+        print(f"✅ Model loaded in {startup['load_seconds']:.1f}s, warming up at lengths {WARMUP} ...")
+
+        startup["parity_max_diff"] = check_encode_parity(loaded_model, loaded_tokenizer, atol=PARITY_TOLERANCE)
+        print(f"✅ Serving path matches model.encode (max abs diff {startup['parity_max_diff']})")
+
+        startup["status"] = "warming"
+        started = time.perf_counter()
+        startup["warmup_by_length"] = warm_up(loaded_model, loaded_tokenizer, WARMUP, WARMUP_BATCH_SIZE)
+        startup["warmup_seconds"] = time.perf_counter() - started
+
+        tokenizer, model = loaded_tokenizer, loaded_model
+        startup["status"] = "ready"
+        print(f"✅ Ready after {startup['warmup_seconds']:.1f}s of warm-up.")
+    except Exception as e:
+        startup["status"] = "failed"
+        startup["error"] = repr(e)
+        print(f"❌ Model startup failed: {e!r}")
+
+def is_ready() -> bool:
+    return startup["status"] == "ready"
+
+def not_ready_response():
+    return JSONResponse(
+        {"error": f"Model is not ready ({startup['status']})", "status": startup["status"]},
+        status_code=503,
+        headers={"Retry-After": "1"},
+    )
+
+# ---------------------------
+# Metrics
+# ---------------------------
+metrics = Registry()
+REQUEST_SECONDS = metrics.histogram("embedding_request_seconds", "Time to serve a request, by route", LATENCY_BUCKETS, label="route")
+TOKENIZE_SECONDS = metrics.histogram("embedding_tokenize_seconds", "Tokenizer time per encoded batch (the only tokenizer pass)", LATENCY_BUCKETS)
+FORWARD_SECONDS = metrics.histogram("embedding_forward_seconds", "Padding, encoder forward and mean pooling time per encoded batch", LATENCY_BUCKETS)
+BATCH_SIZE = metrics.histogram("embedding_batch_size", "Texts per encoded batch", BATCH_SIZE_BUCKETS)
+BATCH_TOKENS = metrics.histogram("embedding_batch_tokens", "Tokens per encoded batch", TOKEN_BUCKETS)
+ROUTES = {"/", "/health", "/metrics", "/embed", "/embed/batch", "/embed/stream"}
+
+
+class RequestTimer:
+    """
+    ASGI middleware observing each request's latency until its last body chunk is sent.
 
-print(f"🚀 Loading model '{model_name}' on {device} ...")
+    Plain ASGI rather than @app.middleware so streamed request bodies reach
+    /embed/stream untouched and streamed responses are timed to completion.
+    """
 
-tokenizer = AutoTokenizer.from_pretrained(model_name)
-model = AutoModel.from_pretrained(model_name, trust_remote_code=True).to(device)
-model.eval()
+    def __init__(self, app):
+        self.app = app
 
-print("✅ Model loaded successfully.")
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        route = scope["path"] if scope["path"] in ROUTES else "other"
+        start = time.perf_counter()
+
+        async def timed_send(message):
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                REQUEST_SECONDS.observe(time.perf_counter() - start, route)
+
+        await self.app(scope, receive, timed_send)
 
 # ---------------------------
 # FastAPI setup
 # ---------------------------
-app = FastAPI(title="Embedding API", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    threading.Thread(target=load_and_warm_up, name="model-loader", daemon=True).start()
+    yield
+
+app = FastAPI(title="Embedding API", version="1.0.0", lifespan=lifespan)
+app.add_middleware(RequestTimer)
 
 class EmbedRequest(BaseModel):
     text: str
 
-def embed_text(text: str):
-    with torch.no_grad():
-        if not isinstance(text, str) or not text.strip():
-            raise ValueError("Text must be a non-empty string.")
-        embedding = model.encode(text, task="text-matching")
-        return embedding.tolist()
+class EmbedBatchRequest(BaseModel):
+    texts: list[str]
+
+def validate_text(text: str):
+    if not isinstance(text, str) or not text.strip():
+        raise ValueError("Text must be a non-empty string.")
+
+def embed_texts(texts: list[str]):
+    """Encode a list of texts in forward passes of up to MAX_BATCH_SIZE, bucketed by length."""
+    if not texts:
+        return []
+    for text in texts:
+        validate_text(text)
+    # One tokenizer pass whose ids go straight to the encoder, so the two timings split the work
+    start = time.perf_counter()
+    input_ids = tokenize(model, tokenizer, texts)
+    tokenized = time.perf_counter()
+    embeddings = encode_tokenized(model, tokenizer, input_ids, MAX_BATCH_SIZE, bucketed=LENGTH_BUCKETING)
+    TOKENIZE_SECONDS.observe(tokenized - start)
+    FORWARD_SECONDS.observe(time.perf_counter() - tokenized)
+    BATCH_SIZE.observe(len(texts))
+    BATCH_TOKENS.observe(sum(len(ids) for ids in input_ids))
+    return embeddings
+
+
+class MicroBatcher:
+    """
+    Collects single-text requests from concurrent callers and encodes them together.
+
+    A batch is flushed as soon as it holds max_batch_size texts or max_wait_ms has
+    passed since its first text arrived, whichever comes first.
+    """
+
+    def __init__(self, encode_fn, max_batch_size: int = MAX_BATCH_SIZE, max_wait_ms: float = MAX_WAIT_MS):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.queue = queue.Queue()
+        self.worker = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self.worker.start()
+
+    def submit(self, text: str) -> Future:
+        """Queue a text for encoding and return a future for its embedding."""
+        future = Future()
+        self.queue.put((text, future))
+        return future
+
+    def _collect(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            texts = [text for text, _ in batch]
+            try:
+                embeddings = self.encode_fn(texts)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), embedding in zip(batch, embeddings):
+                future.set_result(embedding)
+
+
+batcher = MicroBatcher(embed_texts)
+
+async def embed_text(text: str):
+    """Queue one text on the batcher and await its vector without holding a threadpool worker."""
+    validate_text(text)
+    return await asyncio.wrap_future(batcher.submit(text))
+
+# ---------------------------
+# Response formats
+# ---------------------------
+BINARY_MEDIA_TYPE = "application/octet-stream"
+MSGPACK_MEDIA_TYPE = "application/x-msgpack"
+WIRE_DTYPES = {"float32": "<f4", "float16": "<f2"}
+
+def embedding_response(request: Request, embeddings, single: bool):
+    """
+    Serialize embeddings according to the request's Accept header.
+
+    application/octet-stream returns raw little-endian float32/float16 bytes (dtype
+    from X-Embedding-Dtype or ?dtype=, shape in X-Embedding-Shape);
+    application/x-msgpack returns {"dtype", "shape", "data"}; anything else is JSON.
+    """
+    accept = request.headers.get("accept", "")
+    binary = BINARY_MEDIA_TYPE in accept
+    packed = MSGPACK_MEDIA_TYPE in accept
+    if not binary and not packed:
+        embeddings = [embedding.tolist() for embedding in embeddings]
+        return {"embedding": embeddings[0]} if single else {"embeddings": embeddings}
+
+    dtype = request.headers.get("x-embedding-dtype") or request.query_params.get("dtype") or "float32"
+    if dtype not in WIRE_DTYPES:
+        return JSONResponse({"error": f"Unsupported dtype '{dtype}'"}, status_code=406)
+    array = np.ascontiguousarray(np.asarray(embeddings, dtype=WIRE_DTYPES[dtype]))
+
+    if packed:
+        if msgpack is None:
+            return JSONResponse({"error": "msgpack is not installed on the server"}, status_code=406)
+        body = msgpack.packb({"dtype": dtype, "shape": list(array.shape), "data": array.tobytes()})
+        return Response(content=body, media_type=MSGPACK_MEDIA_TYPE)
+
+    headers = {"X-Embedding-Dtype": dtype, "X-Embedding-Shape": ",".join(str(n) for n in array.shape)}
+    return Response(content=array.tobytes(), media_type=BINARY_MEDIA_TYPE, headers=headers)
 
 @app.get("/")
 def root():
@@ -38,16 +266,134 @@ def root():
 
 @app.get("/health")
 def health_check():
-    return {"device": device, "model_name": model_name, "status": "ready"}
+    """200 once the model is loaded and warmed up, 503 while loading, warming or failed."""
+    body = {
+        "device": device,
+        "model_name": model_name,
+        "model_path": MODEL_PATH,
+        "quantization": QUANTIZATION,
+        "threads": {"intra_op": torch.get_num_threads(), "inter_op": torch.get_num_interop_threads()},
+        "status": startup["status"],
+        "startup": {
+            "load_seconds": startup["load_seconds"],
+            "warmup_seconds": startup["warmup_seconds"],
+            "warmup_by_length": startup["warmup_by_length"],
+            "parity_max_diff": startup["parity_max_diff"],
+            "error": startup["error"],
+        },
+    }
+    return JSONResponse(body, status_code=200 if is_ready() else 503)
+
+@app.get("/metrics")
+def get_metrics():
+    return Response(content=metrics.render(), media_type=METRICS_CONTENT_TYPE)
 
 @app.post("/embed")
-def get_embedding(req: EmbedRequest):
+async def get_embedding(req: EmbedRequest, request: Request):
+    if not is_ready():
+        return not_ready_response()
+    try:
+        embedding = await embed_text(req.text)
+        return embedding_response(request, [embedding], single=True)
+    except Exception as e:
+        return {"error": str(e)}
+
+@app.post("/embed/batch")
+def get_embeddings(req: EmbedBatchRequest, request: Request):
+    if not is_ready():
+        return not_ready_response()
     try:
-        embedding = embed_text(req.text)
-        return {"embedding": embedding}
+        embeddings = embed_texts(req.texts)
+        return embedding_response(request, embeddings, single=False)
     except Exception as e:
         return {"error": str(e)}
-    
+
+# ---------------------------
+# Streaming bulk encoding
+# ---------------------------
+class DuplexStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that leaves receive() to the body generator.
+
+    Starlette's default listens for client disconnects by calling receive()
+    alongside the generator, which would steal request-body messages from an
+    endpoint that reads its input while streaming its output.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+async def encode_stream_batch(records: list[dict]) -> bytes:
+    """Encode one batch of {id, text} records into NDJSON lines, in input order."""
+    valid = []
+    for record in records:
+        if "error" in record:
+            continue
+        try:
+            validate_text(record.get("text"))
+            valid.append(record)
+        except ValueError as e:
+            record["error"] = str(e)
+
+    embeddings = await run_in_threadpool(embed_texts, [record["text"] for record in valid]) if valid else []
+    for record, embedding in zip(valid, embeddings):
+        record["embedding"] = embedding.tolist()
+
+    lines = []
+    for record in records:
+        if "error" in record:
+            lines.append(json.dumps({"id": record.get("id"), "error": record["error"]}))
+        else:
+            lines.append(json.dumps({"id": record.get("id"), "embedding": record["embedding"]}))
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+def parse_stream_record(line: bytes) -> dict:
+    """One NDJSON record; lines that are not a JSON object become per-record errors."""
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return {"id": None, "error": "Invalid JSON record"}
+    if not isinstance(record, dict):
+        return {"id": None, "error": "Record must be a JSON object with id and text"}
+    return record
+
+async def stream_embeddings(request: Request):
+    """
+    Read NDJSON records from the request body and yield their embeddings.
+
+    The request body is only read as fast as the response is consumed, so a slow
+    client throttles the upload and server memory stays bounded by one batch.
+    """
+    buffer, batch = b"", []
+    async for chunk in request.stream():
+        buffer += chunk
+        if b"\n" not in buffer:
+            if len(buffer) > MAX_STREAM_LINE_BYTES:
+                yield (json.dumps({"id": None, "error": "Record exceeds MAX_STREAM_LINE_BYTES"}) + "\n").encode("utf-8")
+                return
+            continue
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if not line.strip():
+                continue
+            batch.append(parse_stream_record(line))
+            if len(batch) >= STREAM_BATCH_SIZE:
+                yield await encode_stream_batch(batch)
+                batch = []
+
+    if buffer.strip():
+        batch.append(parse_stream_record(buffer))
+    if batch:
+        yield await encode_stream_batch(batch)
+
+@app.post("/embed/stream")
+async def get_embeddings_stream(request: Request):
+    if not is_ready():
+        return not_ready_response()
+    return DuplexStreamingResponse(stream_embeddings(request), media_type="application/x-ndjson")
+
 # if __name__ == "__main__":
 #     import uvicorn
-#     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+#     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,114 @@
+"""
+Compare CPU serving modes of the embedding model.
+
+Measures tokens/sec for fp32, fp32 with length bucketing and int8 with length
+bucketing, and the cosine drift of the int8 embeddings against fp32. Run it on
+a sample of the corpus you intend to serve, e.g.
+
+    python benchmark_cpu.py --corpus /path/to/scidocs/corpus.jsonl --samples 512
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from inference import MODEL_NAME, configure_threads, count_quantized_layers, load_model, encode, encode_bucketed, token_lengths
+
+DEFAULT_TEXTS = [
+    "Dense retrieval embeds queries and documents into the same vector space.",
+    "The Gazetteer of the Naga Hills district should only be regarded as a supplement to the monographs on the various Naga tribes.",
+    "To improve energy efficiency in copper electrowinning, different technologies have been developed.",
+    "Short query",
+]
+
+
+def load_texts(path: str, samples: int):
+    """Read up to `samples` texts from a BEIR corpus.jsonl or a convert-md.py chunk file."""
+    if not path:
+        return (DEFAULT_TEXTS * (samples // len(DEFAULT_TEXTS) + 1))[:samples]
+    texts = []
+    with open(path, "r", encoding="utf-8") as f:
+        records = json.load(f) if path.lower().endswith(".json") else (json.loads(line) for line in f if line.strip())
+        for record in records:
+            text = record.get("text") or record.get("content")
+            if text:
+                texts.append(text)
+            if len(texts) >= samples:
+                break
+    return texts
+
+
+def run_mode(name: str, embed_fn, texts, total_tokens: int, repeats: int):
+    embed_fn(texts[:min(len(texts), 8)])  # warm-up
+    elapsed = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        embeddings = embed_fn(texts)
+        elapsed.append(time.perf_counter() - start)
+    best = min(elapsed)
+    print(f"  {name:<22} {total_tokens / best:10.0f} tokens/s  ({best:.2f}s for {len(texts)} texts)")
+    return embeddings, total_tokens / best
+
+
+def cosine_rows(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    return np.einsum("ij,ij->i", a, b)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark fp32 vs int8 CPU inference for the embedding service.")
+    parser.add_argument("--corpus", help="corpus.jsonl or chunk .json/.jsonl to sample texts from")
+    parser.add_argument("--samples", type=int, default=256)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--intra-op-threads", type=int)
+    parser.add_argument("--inter-op-threads", type=int)
+    parser.add_argument("--min-cosine", type=float, default=0.99, help="Worst-case cosine to fp32 considered safe")
+    parser.add_argument("--output", help="Write the results as JSON")
+    args = parser.parse_args()
+
+    configure_threads(args.intra_op_threads, args.inter_op_threads)
+    texts = load_texts(args.corpus, args.samples)
+
+    print(f"🚀 Loading fp32 and int8 '{MODEL_NAME}' on cpu ...")
+    tokenizer, fp32_model = load_model(MODEL_NAME, "cpu")
+    _, int8_model = load_model(MODEL_NAME, "cpu", quantization="int8")
+    quantized_layers = count_quantized_layers(int8_model)
+    print(f"🔧 int8 model has {quantized_layers} quantized Linear layers")
+    if not quantized_layers:
+        print("⚠️ Nothing was quantized; the int8 numbers below are fp32 in disguise")
+
+    lengths = token_lengths(tokenizer, texts)
+    total_tokens = sum(lengths)
+    print(f"📊 {len(texts)} texts, {total_tokens} tokens (mean {total_tokens / len(texts):.0f})")
+
+    fp32, fp32_tps = run_mode("fp32", lambda batch: encode(fp32_model, batch, args.batch_size), texts, total_tokens, args.repeats)
+    _, bucketed_tps = run_mode(
+        "fp32 + bucketing",
+        lambda batch: encode_bucketed(fp32_model, tokenizer, batch, args.batch_size),
+        texts, total_tokens, args.repeats,
+    )
+    int8, int8_tps = run_mode(
+        "int8 + bucketing",
+        lambda batch: encode_bucketed(int8_model, tokenizer, batch, args.batch_size),
+        texts, total_tokens, args.repeats,
+    )
+
+    cosines = cosine_rows(fp32, int8)
+    print(f"\n📐 int8 vs fp32 cosine: mean {cosines.mean():.5f}, p1 {np.percentile(cosines, 1):.5f}, min {cosines.min():.5f}")
+    safe = bool(cosines.min() >= args.min_cosine)
+    print(f"{'✅' if safe else '❌'} int8 mode is {'within' if safe else 'outside'} the {args.min_cosine} cosine threshold; "
+          f"speed-up {int8_tps / fp32_tps:.2f}x over fp32")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({
+                "texts": len(texts),
+                "tokens": total_tokens,
+                "quantized_layers": quantized_layers,
+                "tokens_per_second": {"fp32": fp32_tps, "fp32_bucketed": bucketed_tps, "int8_bucketed": int8_tps},
+                "cosine": {"mean": float(cosines.mean()), "p1": float(np.percentile(cosines, 1)), "min": float(cosines.min())},
+                "safe": safe,
+            }, f, indent=2)
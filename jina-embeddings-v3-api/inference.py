@@ -0,0 +1,256 @@
+import json
+import os
+import time
+
+import numpy as np
+import torch
+from huggingface_hub import try_to_load_from_cache
+from torch.nn.utils import parametrize
+from transformers import AutoTokenizer, AutoModel
+
+MODEL_NAME = "jinaai/jina-embeddings-v3"
+TASK = "text-matching"
+MAX_LENGTH = 8192
+WARMUP_LENGTHS = (16, 128, 512)
+PARITY_ATOL = 1e-3
+PARITY_TEXTS = (
+    "hello",
+    "Mean pooling must ignore the padding of shorter texts in the same batch.",
+    " ".join(["The serving path pads token ids itself before running the encoder."] * 20),
+)
+# jina-embeddings-v3's config.json loads its modelling code from this repo via auto_map
+IMPLEMENTATION_REPO = "jinaai/xlm-roberta-flash-implementation"
+
+
+def configure_threads(intra_op_threads: int = None, inter_op_threads: int = None):
+    """Pin torch's thread pools; must run before the first parallel op."""
+    if intra_op_threads:
+        torch.set_num_threads(intra_op_threads)
+    if inter_op_threads:
+        try:
+            torch.set_num_interop_threads(inter_op_threads)
+        except RuntimeError:
+            # Already fixed once inter-op work has started; keep the existing pool
+            pass
+
+
+def _ignore_task_kwargs(module):
+    """
+    Let a folded layer be called like a LoRA layer.
+
+    The model still passes task_id (and residual) to its Linear layers; once the
+    adapter is folded into the weights they have nothing left to select.
+    """
+    forward = module.forward
+
+    def task_free_forward(input, task_id=None, residual=False):
+        output = forward(input)
+        return (output, input) if residual else output
+
+    module.forward = task_free_forward
+    return module
+
+
+def fold_task_adapter(model, task: str = TASK) -> int:
+    """
+    Merge one task's LoRA adapter into the weights of every adapted nn.Linear.
+
+    jina-embeddings-v3 registers a LoRA parametrization on each encoder Linear and
+    adds lora_B @ lora_A for the requested task at call time. The service only
+    serves `task`, so the sum is computed once and the parametrization removed,
+    leaving plain Linear layers. Embedding layers keep their adapters. Returns the
+    number of layers folded.
+    """
+    task_id = model._adaptation_map[task]
+    folded = 0
+    with torch.no_grad():
+        for module in model.modules():
+            if not isinstance(module, torch.nn.Linear) or not parametrize.is_parametrized(module, "weight"):
+                continue
+            lora = module.parametrizations.weight[0]
+            if not hasattr(lora, "lora_forward"):
+                continue
+            merged = lora.lora_forward(module.weight, current_task=task_id)
+            parametrize.remove_parametrizations(module, "weight", leave_parametrized=False)
+            module.weight.copy_(merged)
+            module.__dict__.pop("forward", None)  # the LoRA-aware forward installed by the model
+            _ignore_task_kwargs(module)
+            folded += 1
+    return folded
+
+
+def quantize_linear_layers(model, task: str = TASK):
+    """
+    Dynamic int8 quantization of the model's nn.Linear layers.
+
+    The served task's adapter is folded in first (see fold_task_adapter); layers
+    are converted in place so the fp32 model is never copied.
+    """
+    folded = fold_task_adapter(model, task)
+    quantized = 0
+    for name, module in list(model.named_modules()):
+        if type(module) is not torch.nn.Linear:
+            continue
+        module.qconfig = torch.ao.quantization.default_dynamic_qconfig
+        int8_module = _ignore_task_kwargs(torch.ao.nn.quantized.dynamic.Linear.from_float(module))
+        parent_name, _, attr = name.rpartition(".")
+        setattr(model.get_submodule(parent_name) if parent_name else model, attr, int8_module)
+        quantized += 1
+    print(f"🔧 Folded the '{task}' adapter into {folded} layers, quantized {quantized} Linear layers to int8")
+    return model
+
+
+def count_quantized_layers(model) -> int:
+    return sum(isinstance(module, torch.ao.nn.quantized.dynamic.Linear) for module in model.modules())
+
+
+def remote_code_is_cached(model_path: str) -> bool:
+    """
+    Whether every remote-code module a snapshot's auto_map points at is in the HF cache.
+
+    `huggingface-cli download <model> --local-dir` fetches only the model repo; code
+    referenced as "<repo>--<module>.<Class>" lives in another repo and must already
+    be in HF_HOME for a local_files_only load to succeed.
+    """
+    config_path = os.path.join(model_path, "config.json")
+    if not os.path.exists(config_path):
+        return False
+    with open(config_path, "r", encoding="utf-8") as f:
+        auto_map = json.load(f).get("auto_map", {})
+    for value in auto_map.values():
+        for reference in value if isinstance(value, list) else [value]:
+            if not reference or "--" not in reference:
+                continue  # shipped inside the snapshot itself
+            repo_id, class_path = reference.split("--", 1)
+            module = class_path.rsplit(".", 1)[0]
+            if not isinstance(try_to_load_from_cache(repo_id, f"{module}.py"), str):
+                return False
+    return True
+
+
+def load_model(model_name: str = MODEL_NAME, device: str = "cpu", quantization: str = None, model_path: str = None):
+    """
+    Load the tokenizer and model, from a local snapshot directory when model_path is given.
+
+    A local snapshot is read without touching the network once its remote code is
+    cached too (see remote_code_is_cached); otherwise only that code is fetched from
+    the Hub. Safetensors weights are memory-mapped straight into the model
+    (low_cpu_mem_usage) instead of being materialized twice.
+    """
+    source = model_path or model_name
+    local_only = model_path is not None and remote_code_is_cached(model_path)
+    if model_path is not None and not local_only:
+        print(f"⚠️ Remote code for '{model_path}' is not in the HF cache; fetching it from the Hub. "
+              f"Run `huggingface-cli download {IMPLEMENTATION_REPO}` beforehand to start offline.")
+    tokenizer = AutoTokenizer.from_pretrained(source, local_files_only=local_only)
+    model = AutoModel.from_pretrained(
+        source, trust_remote_code=True, local_files_only=local_only, use_safetensors=True, low_cpu_mem_usage=True,
+    )
+    if quantization == "int8":
+        if device != "cpu":
+            raise ValueError("int8 dynamic quantization is only supported on CPU")
+        model = quantize_linear_layers(model)
+    model = model.to(device)
+    model.eval()
+    return tokenizer, model
+
+
+def token_lengths(tokenizer, texts: list[str]) -> list[int]:
+    encoded = tokenizer(texts, add_special_tokens=True, truncation=True, max_length=MAX_LENGTH)
+    return [len(ids) for ids in encoded["input_ids"]]
+
+
+def encode(model, texts: list[str], batch_size: int, task: str = TASK) -> np.ndarray:
+    with torch.no_grad():
+        return np.asarray(model.encode(texts, task=task, batch_size=batch_size), dtype=np.float32)
+
+
+def tokenize(model, tokenizer, texts: list[str], task: str = TASK) -> list[list[int]]:
+    """
+    Unpadded token ids of each text, with the task instruction model.encode would prepend.
+
+    This is the only tokenizer pass on the serving path: encode_tokenized pads and
+    runs these ids directly, so lengths for bucketing and metrics come for free.
+    """
+    prefix = (getattr(model, "_task_instructions", None) or {}).get(task) or ""
+    encoded = tokenizer([prefix + text for text in texts], add_special_tokens=True, truncation=True, max_length=MAX_LENGTH)
+    return encoded["input_ids"]
+
+
+def forward_pooled(model, tokenizer, input_ids: list[list[int]], task: str = TASK) -> np.ndarray:
+    """Pad one batch of token ids, run the encoder with the task adapter and mean-pool, as model.encode does."""
+    batch = tokenizer.pad({"input_ids": input_ids}, padding=True, return_tensors="pt").to(model.device)
+    adapter_mask = torch.full((len(input_ids),), model._adaptation_map[task], dtype=torch.int32, device=model.device)
+    with torch.inference_mode():
+        token_embeddings = model.roberta(**batch, adapter_mask=adapter_mask)[0].float()
+        mask = batch["attention_mask"].unsqueeze(-1).float()
+        pooled = (token_embeddings * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+        return torch.nn.functional.normalize(pooled, p=2, dim=1).cpu().numpy()
+
+
+def encode_tokenized(model, tokenizer, input_ids: list[list[int]], batch_size: int, task: str = TASK, bucketed: bool = True) -> np.ndarray:
+    """
+    Encode pre-tokenized texts in batches of up to batch_size, returned in input order.
+
+    With bucketed, texts are sorted by token count first so each batch pads to a
+    similar length.
+    """
+    lengths = [len(ids) for ids in input_ids]
+    order = np.argsort(lengths, kind="stable") if bucketed else np.arange(len(input_ids))
+    embeddings = None
+    for start in range(0, len(input_ids), batch_size):
+        idx = order[start:start + batch_size]
+        batch = forward_pooled(model, tokenizer, [input_ids[i] for i in idx], task)
+        if embeddings is None:
+            embeddings = np.empty((len(input_ids), batch.shape[1]), dtype=np.float32)
+        embeddings[idx] = batch
+    return embeddings if embeddings is not None else np.zeros((0, 0), dtype=np.float32)
+
+
+def encode_bucketed(model, tokenizer, texts: list[str], batch_size: int, task: str = TASK) -> np.ndarray:
+    """Tokenize once, then encode in batches of similar token count to minimise padding."""
+    return encode_tokenized(model, tokenizer, tokenize(model, tokenizer, texts, task), batch_size, task)
+
+
+def check_encode_parity(model, tokenizer, tasks=(TASK,), texts=PARITY_TEXTS, atol: float = PARITY_ATOL) -> dict:
+    """
+    Compare encode_tokenized with model.encode on a few texts, per task.
+
+    The serving path re-implements model.encode on top of the model's private
+    _task_instructions, _adaptation_map and roberta(adapter_mask=...); a change in
+    the remote code would silently shift every vector. Raises RuntimeError when
+    any element differs by more than atol; returns the largest difference per task.
+    """
+    drift = {}
+    for task in tasks:
+        expected = encode(model, list(texts), len(texts), task)
+        actual = encode_bucketed(model, tokenizer, list(texts), len(texts), task)
+        drift[task] = float(np.abs(expected - actual).max()) if expected.shape == actual.shape else float("inf")
+        if not drift[task] <= atol:
+            raise RuntimeError(
+                f"encode_tokenized drifted from model.encode for task '{task}' "
+                f"(max abs diff {drift[task]:.2e} > {atol:.0e}, shapes {actual.shape} vs {expected.shape})"
+            )
+    return drift
+
+
+def warm_up(model, tokenizer, lengths=WARMUP_LENGTHS, batch_size: int = 8, task: str = TASK):
+    """
+    Run one batch at each representative sequence length before serving.
+
+    Triggers lazy initialization, kernel selection and allocator growth up front so
+    the first real requests see steady-state latency. Returns seconds per length.
+    """
+    timings = {}
+    for length in lengths:
+        # "hello" is one token, so the text is ~length tokens including special tokens
+        text = " ".join(["hello"] * max(1, length - 2))
+        start = time.perf_counter()
+        encode_tokenized(model, tokenizer, tokenize(model, tokenizer, [text] * batch_size, task), batch_size, task)
+        timings[length] = time.perf_counter() - start
+    return timings
+
+
+def env_int(name: str):
+    value = os.getenv(name)
+    return int(value) if value else None
@@ -0,0 +1,56 @@
+import bisect
+import threading
+
+# Prometheus text exposition format, version 0.0.4
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+TOKEN_BUCKETS = (16, 64, 256, 1024, 4096, 16384, 65536, 262144)
+
+
+class Histogram:
+    """Cumulative-bucket histogram, optionally split by one label, safe to observe from any thread."""
+
+    def __init__(self, name: str, help_text: str, buckets, label: str = None):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.label = label
+        self.lock = threading.Lock()
+        self.series = {}  # label value -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value: float, label_value: str = ""):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.setdefault(label_value, [0] * (len(self.buckets) + 2))
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            snapshot = {key: list(series) for key, series in self.series.items()}
+        for label_value, series in sorted(snapshot.items()):
+            labels = f'{self.label}="{label_value}",' if self.label else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels}le="{bound}"}} {cumulative}')
+            suffix = f"{{{labels.rstrip(',')}}}" if labels else ""
+            lines.append(f"{self.name}_sum{suffix} {series[-1]}")
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def histogram(self, name: str, help_text: str, buckets, label: str = None) -> Histogram:
+        metric = Histogram(name, help_text, buckets, label)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self.metrics for line in metric.render()) + "\n"
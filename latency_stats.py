@@ -0,0 +1,19 @@
+import math
+
+
+def percentile(values, p: float) -> float:
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(p / 100.0 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def summarize(values_ms) -> dict:
+    return {
+        "mean": sum(values_ms) / len(values_ms) if values_ms else 0.0,
+        "p50": percentile(values_ms, 50),
+        "p95": percentile(values_ms, 95),
+        "p99": percentile(values_ms, 99),
+    }
@@ -0,0 +1,462 @@
+import json
+import os
+import shutil
+
+import numpy as np
+
+LOCAL_INDEX_DIR = "local_index"
+
+INCLUDE_DEFAULT = ["metadatas", "documents", "distances"]
+
+
+class LocalCollection:
+    """
+    Exact-search vector collection stored on local disk.
+
+    Mirrors the subset of Chroma's async collection API the rest of the repo uses
+    (add / upsert / get / delete / count / query) so ChromaManager can swap it in
+    for a server collection. Vectors are a memory-mapped float32 or float16 matrix;
+    ids, documents and metadata live in an append-only JSONL sidecar that is
+    replayed on load. Queries are answered with blocked matrix multiplies and an
+    argpartition top-k, so results are exact.
+
+    With quantization="int8" or "binary" the first pass instead scans a compact
+    in-memory copy of the vectors (optionally truncated to their first
+    truncate_dim Matryoshka dimensions), and the best k * rescore_multiplier
+    candidates are rescored against the full-precision rows read from disk.
+    """
+
+    MANIFEST_FILE = "manifest.json"
+    RECORDS_FILE = "records.jsonl"
+    GROW_ROWS = 4096
+    BLOCK_ROWS = 16384
+    QUERY_BATCH = 256
+
+    def __init__(
+        self,
+        directory: str,
+        name: str,
+        dtype: str = "float32",
+        space: str = "l2",
+        quantization: str = None,
+        truncate_dim: int = None,
+        rescore_multiplier: int = 4,
+    ):
+        if space not in ("l2", "ip", "cosine"):
+            raise ValueError(f"Unsupported space '{space}'")
+        if quantization not in (None, "int8", "binary"):
+            raise ValueError(f"Unsupported quantization '{quantization}'")
+        self.directory = directory
+        self.name = name
+        self.dtype = np.dtype(dtype)
+        self.space = space
+        self.dim = None
+        self.size = 0  # rows ever written, including deleted ones
+        self.capacity = 0
+        self.vectors = None
+        self.sq_norms = np.zeros(0, dtype=np.float32)
+        self.alive = np.zeros(0, dtype=bool)
+        self.ids, self.documents, self.metadatas = [], [], []
+        self.rows = {}  # id -> row
+
+        # First-pass search structures, kept in memory when quantization is enabled
+        self.quantization = quantization
+        self.truncate_dim = truncate_dim
+        self.rescore_multiplier = rescore_multiplier
+        self.codes = None
+        self.code_scales = None
+        self.code_sq_norms = None
+
+        os.makedirs(directory, exist_ok=True)
+        self.manifest_path = os.path.join(directory, self.MANIFEST_FILE)
+        self.records_path = os.path.join(directory, self.RECORDS_FILE)
+        self._load()
+
+    @property
+    def vectors_path(self):
+        return os.path.join(self.directory, f"vectors.{'f16' if self.dtype == np.float16 else 'f32'}")
+
+    # ---------------------------
+    # Persistence
+    # ---------------------------
+    def _load(self):
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            self.dim = manifest["dim"]
+            self.dtype = np.dtype(manifest["dtype"])
+            self.space = manifest["space"]
+
+        if self.dim is None or not os.path.exists(self.records_path) or not os.path.exists(self.vectors_path):
+            return
+
+        with open(self.records_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                row = record["row"]
+                self._ensure_rows(row + 1, grow_file=False)
+                if record.get("deleted"):
+                    self.alive[row] = False
+                    self.rows.pop(self.ids[row], None)
+                    continue
+                self.ids[row] = record["id"]
+                self.documents[row] = record.get("document")
+                self.metadatas[row] = record.get("metadata")
+                self.alive[row] = True
+                self.rows[record["id"]] = row
+
+        rows_on_disk = os.path.getsize(self.vectors_path) // (self.dim * self.dtype.itemsize)
+        self._open_vectors(max(rows_on_disk, self.size))
+        self.sq_norms[:self.size] = self._row_sq_norms(0, self.size)
+        if self.quantization:
+            for start in range(0, self.size, self.BLOCK_ROWS):
+                stop = min(start + self.BLOCK_ROWS, self.size)
+                self._encode_rows(np.arange(start, stop), np.asarray(self.vectors[start:stop], dtype=np.float32))
+
+    def _write_manifest(self):
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"name": self.name, "dim": self.dim, "dtype": self.dtype.name, "space": self.space}, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _open_vectors(self, rows: int):
+        if self.vectors is not None:
+            self.vectors.flush()
+            self.vectors = None
+        with open(self.vectors_path, "ab") as f:
+            f.truncate(rows * self.dim * self.dtype.itemsize)
+        self.vectors = np.memmap(self.vectors_path, dtype=self.dtype, mode="r+", shape=(rows, self.dim)) if rows else None
+        self.capacity = rows
+
+    def _ensure_rows(self, rows: int, grow_file: bool = True):
+        """Grow the in-memory row state (and optionally the vector file) to hold rows."""
+        if rows > len(self.ids):
+            extra = rows - len(self.ids)
+            self.ids.extend([None] * extra)
+            self.documents.extend([None] * extra)
+            self.metadatas.extend([None] * extra)
+            self.alive = np.concatenate([self.alive, np.zeros(extra, dtype=bool)])
+            self.sq_norms = np.concatenate([self.sq_norms, np.zeros(extra, dtype=np.float32)])
+        self.size = max(self.size, rows)
+        if grow_file and rows > self.capacity:
+            self._open_vectors(max(rows, self.capacity + self.GROW_ROWS))
+
+    def _append_records(self, records: list[dict]):
+        with open(self.records_path, "a", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def _row_sq_norms(self, start: int, stop: int):
+        norms = np.empty(stop - start, dtype=np.float32)
+        for block_start in range(start, stop, self.BLOCK_ROWS):
+            block_stop = min(block_start + self.BLOCK_ROWS, stop)
+            block = np.asarray(self.vectors[block_start:block_stop], dtype=np.float32)
+            norms[block_start - start:block_stop - start] = np.einsum("ij,ij->i", block, block)
+        return norms
+
+    def persist(self):
+        if self.vectors is not None:
+            self.vectors.flush()
+
+    # ---------------------------
+    # Chroma-compatible API
+    # ---------------------------
+    async def count(self):
+        return int(self.alive[:self.size].sum())
+
+    async def add(self, ids, embeddings, metadatas=None, documents=None):
+        """Add new records; ids that already exist are skipped, as Chroma does."""
+        keep = [i for i, record_id in enumerate(ids) if record_id not in self.rows]
+        if not keep:
+            return
+        await self._write(
+            [ids[i] for i in keep],
+            np.asarray(embeddings, dtype=np.float32)[keep],
+            [metadatas[i] for i in keep] if metadatas is not None else None,
+            [documents[i] for i in keep] if documents is not None else None,
+        )
+
+    async def upsert(self, ids, embeddings, metadatas=None, documents=None):
+        await self._write(list(ids), np.asarray(embeddings, dtype=np.float32), metadatas, documents)
+
+    async def _write(self, ids, embeddings, metadatas, documents):
+        if embeddings.ndim != 2 or len(embeddings) != len(ids):
+            raise ValueError("Expected one embedding per id")
+        if self.dim is None:
+            self.dim = embeddings.shape[1]
+            self._write_manifest()
+        elif embeddings.shape[1] != self.dim:
+            raise ValueError(f"Embedding dimension {embeddings.shape[1]} does not match collection dimension {self.dim}")
+
+        rows, assigned = [], {}
+        next_row = self.size
+        for record_id in ids:
+            row = self.rows.get(record_id, assigned.get(record_id))
+            if row is None:
+                row = assigned[record_id] = next_row
+                next_row += 1
+            rows.append(row)
+        self._ensure_rows(next_row)
+
+        rows = np.asarray(rows)
+        self.vectors[rows] = embeddings.astype(self.dtype)
+        self.sq_norms[rows] = np.einsum("ij,ij->i", embeddings, embeddings)
+        self.vectors.flush()
+        if self.quantization:
+            self._encode_rows(rows, embeddings)
+
+        records = []
+        for i, (row, record_id) in enumerate(zip(rows.tolist(), ids)):
+            document = documents[i] if documents is not None else None
+            metadata = metadatas[i] if metadatas is not None else None
+            self.ids[row], self.documents[row], self.metadatas[row] = record_id, document, metadata
+            self.alive[row] = True
+            self.rows[record_id] = row
+            records.append({"row": row, "id": record_id, "document": document, "metadata": metadata})
+        self._append_records(records)
+
+    async def update(self, ids, embeddings=None, metadatas=None, documents=None):
+        """Overwrite fields of existing records; unknown ids are skipped, as Chroma does."""
+        known = [i for i, record_id in enumerate(ids) if record_id in self.rows]
+        if embeddings is not None:
+            embeddings = np.asarray(embeddings, dtype=np.float32)
+            await self._write(
+                [ids[i] for i in known],
+                embeddings[known],
+                [metadatas[i] for i in known] if metadatas is not None else [self.metadatas[self.rows[ids[i]]] for i in known],
+                [documents[i] for i in known] if documents is not None else [self.documents[self.rows[ids[i]]] for i in known],
+            )
+            return
+        records = []
+        for i in known:
+            row = self.rows[ids[i]]
+            if metadatas is not None:
+                self.metadatas[row] = metadatas[i]
+            if documents is not None:
+                self.documents[row] = documents[i]
+            records.append({"row": row, "id": ids[i], "document": self.documents[row], "metadata": self.metadatas[row]})
+        self._append_records(records)
+
+    async def delete(self, ids=None):
+        records = []
+        for record_id in ids or []:
+            row = self.rows.pop(record_id, None)
+            if row is not None:
+                self.alive[row] = False
+                records.append({"row": row, "deleted": True})
+        self._append_records(records)
+
+    async def get(self, ids=None, limit=None, offset=None, include=("metadatas", "documents")):
+        if ids is not None:
+            rows = [self.rows[record_id] for record_id in ids if record_id in self.rows]
+        else:
+            rows = np.flatnonzero(self.alive[:self.size]).tolist()
+            start = offset or 0
+            rows = rows[start:start + limit] if limit is not None else rows[start:]
+
+        result = {"ids": [self.ids[row] for row in rows]}
+        if "embeddings" in include:
+            result["embeddings"] = np.asarray(self.vectors[rows], dtype=np.float32) if rows else np.zeros((0, self.dim or 0), dtype=np.float32)
+        if "documents" in include:
+            result["documents"] = [self.documents[row] for row in rows]
+        if "metadatas" in include:
+            result["metadatas"] = [self.metadatas[row] for row in rows]
+        return result
+
+    async def query(self, query_embeddings, n_results: int = 10, include=INCLUDE_DEFAULT):
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries[None, :]
+
+        all_rows, all_distances = [], []
+        for start in range(0, len(queries), self.QUERY_BATCH):
+            rows, distances = self.search(queries[start:start + self.QUERY_BATCH], n_results)
+            all_rows.extend(rows)
+            all_distances.extend(distances)
+
+        result = {"ids": [[self.ids[row] for row in rows] for rows in all_rows]}
+        if "distances" in include:
+            result["distances"] = [distances.tolist() for distances in all_distances]
+        if "documents" in include:
+            result["documents"] = [[self.documents[row] for row in rows] for rows in all_rows]
+        if "metadatas" in include:
+            result["metadatas"] = [[self.metadatas[row] for row in rows] for rows in all_rows]
+        return result
+
+    # ---------------------------
+    # Quantized first pass
+    # ---------------------------
+    @property
+    def first_pass_dim(self):
+        return min(self.truncate_dim or self.dim, self.dim)
+
+    def _quantize(self, vectors: np.ndarray):
+        """Encode float32 vectors for the first pass; returns (codes, scales)."""
+        vectors = vectors[:, :self.first_pass_dim]
+        if self.space == "cosine":
+            vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        if self.quantization == "binary":
+            return np.packbits(vectors > 0, axis=1), None
+        scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0
+        codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    def _encode_rows(self, rows: np.ndarray, vectors: np.ndarray):
+        codes, scales = self._quantize(vectors)
+        needed = int(rows.max()) + 1 if len(rows) else 0
+        if self.codes is None or needed > len(self.codes):
+            # Grow geometrically so incremental ingest does not copy the codes every batch
+            capacity = max(needed, 2 * (len(self.codes) if self.codes is not None else 0), self.GROW_ROWS)
+            grown = np.zeros((capacity, codes.shape[1]), dtype=codes.dtype)
+            grown_scales = np.zeros(capacity, dtype=np.float32)
+            grown_norms = np.zeros(capacity, dtype=np.float32)
+            if self.codes is not None:
+                grown[:len(self.codes)] = self.codes
+                grown_scales[:len(self.codes)] = self.code_scales
+                grown_norms[:len(self.codes)] = self.code_sq_norms
+            self.codes, self.code_scales, self.code_sq_norms = grown, grown_scales, grown_norms
+
+        self.codes[rows] = codes
+        if self.quantization == "int8":
+            self.code_scales[rows] = scales
+            approx = codes.astype(np.float32) * scales[:, None]
+            self.code_sq_norms[rows] = np.einsum("ij,ij->i", approx, approx)
+
+    def _first_pass_distances(self, start: int, stop: int, queries: np.ndarray):
+        """Approximate distances (rows x queries) from the in-memory codes."""
+        queries = queries[:, :self.first_pass_dim]
+        codes = self.codes[start:stop]
+        if self.quantization == "binary":
+            # Hamming distance via +/-1 dot products: hamming = (dim - dot) / 2
+            signs = np.unpackbits(codes, axis=1, count=self.first_pass_dim).astype(np.float32) * 2.0 - 1.0
+            return -(signs @ np.where(queries > 0, 1.0, -1.0).astype(np.float32).T)
+
+        dots = (codes.astype(np.float32) @ queries.T) * self.code_scales[start:stop, None]
+        if self.space == "ip":
+            return 1.0 - dots
+        if self.space == "cosine":
+            return 1.0 - dots / np.maximum(np.sqrt(self.code_sq_norms[start:stop])[:, None], 1e-12)
+        return self.code_sq_norms[start:stop, None] - 2.0 * dots
+
+    def _rescore(self, queries: np.ndarray, candidates: list[list[int]], k: int):
+        """Exact distances for each query's candidate rows, read from the full-precision matrix."""
+        unique_rows = np.unique(np.concatenate([np.asarray(rows, dtype=np.int64) for rows in candidates]))
+        if not len(unique_rows):
+            return [[] for _ in candidates], [np.zeros(0, dtype=np.float32) for _ in candidates]
+        block = np.asarray(self.vectors[unique_rows], dtype=np.float32)
+        distances = self._distances(block, self.sq_norms[unique_rows], queries)  # unique rows x queries
+
+        results_rows, results_distances = [], []
+        for i, rows in enumerate(candidates):
+            positions = np.searchsorted(unique_rows, rows)
+            query_distances = distances[positions, i]
+            order = np.argsort(query_distances)[:k]
+            results_rows.append([rows[j] for j in order])
+            results_distances.append(query_distances[order])
+        return results_rows, results_distances
+
+    def memory_report(self):
+        """Bytes held by the full-precision vectors versus the first-pass codes."""
+        full_bytes = self.size * (self.dim or 0) * np.dtype(np.float32).itemsize
+        first_pass_bytes = full_bytes
+        if self.quantization and self.codes is not None:
+            first_pass_bytes = self.size * self.codes.shape[1] * self.codes.itemsize
+            if self.quantization == "int8":
+                first_pass_bytes += self.size * 2 * np.dtype(np.float32).itemsize  # scales + norms
+        return {
+            "rows": self.size,
+            "full_bytes": full_bytes,
+            "first_pass_bytes": first_pass_bytes,
+            "saved_bytes": full_bytes - first_pass_bytes,
+            "compression": full_bytes / first_pass_bytes if first_pass_bytes else 1.0,
+        }
+
+    # ---------------------------
+    # Search
+    # ---------------------------
+    def _distances(self, block: np.ndarray, sq_norms: np.ndarray, queries: np.ndarray):
+        """Distances (rows x queries) in Chroma's conventions for the collection space."""
+        dots = block @ queries.T
+        if self.space == "ip":
+            return 1.0 - dots
+        if self.space == "cosine":
+            norms = np.sqrt(sq_norms)[:, None] * np.linalg.norm(queries, axis=1)[None, :]
+            return 1.0 - dots / np.maximum(norms, 1e-12)
+        return sq_norms[:, None] - 2.0 * dots + np.einsum("ij,ij->i", queries, queries)[None, :]
+
+    def _exact_distances(self, start: int, stop: int, queries: np.ndarray):
+        block = np.asarray(self.vectors[start:stop], dtype=np.float32)
+        return self._distances(block, self.sq_norms[start:stop], queries)
+
+    def search(self, queries: np.ndarray, k: int):
+        """Top-k over all live rows; returns per-query row and distance arrays."""
+        if not self.quantization:
+            return self._top_k(queries, k, self._exact_distances)
+        candidates, _ = self._top_k(queries, k * self.rescore_multiplier, self._first_pass_distances)
+        return self._rescore(queries, candidates, k)
+
+    def _top_k(self, queries: np.ndarray, k: int, distance_fn):
+        """Blocked argpartition top-k of distance_fn(start, stop, queries) over live rows."""
+        n_queries = len(queries)
+        best_rows = np.empty((n_queries, 0), dtype=np.int64)
+        best_distances = np.empty((n_queries, 0), dtype=np.float32)
+
+        for start in range(0, self.size, self.BLOCK_ROWS):
+            stop = min(start + self.BLOCK_ROWS, self.size)
+            distances = distance_fn(start, stop, queries).T  # queries x rows
+            distances = np.where(self.alive[start:stop][None, :], distances, np.inf)
+
+            kk = min(k, stop - start)
+            part = np.argpartition(distances, kk - 1, axis=1)[:, :kk]
+            best_rows = np.concatenate([best_rows, part + start], axis=1)
+            best_distances = np.concatenate([best_distances, np.take_along_axis(distances, part, axis=1)], axis=1)
+
+            if best_rows.shape[1] > k:
+                keep = np.argpartition(best_distances, k - 1, axis=1)[:, :k]
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+                best_distances = np.take_along_axis(best_distances, keep, axis=1)
+
+        order = np.argsort(best_distances, axis=1)
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        best_distances = np.take_along_axis(best_distances, order, axis=1)
+
+        results_rows, results_distances = [], []
+        for rows, distances in zip(best_rows, best_distances):
+            finite = np.isfinite(distances)
+            results_rows.append(rows[finite].tolist())
+            results_distances.append(distances[finite])
+        return results_rows, results_distances
+
+
+class LocalClient:
+    """Stand-in for Chroma's AsyncHttpClient that keeps collections under a local directory."""
+
+    def __init__(self, root: str = LOCAL_INDEX_DIR, **collection_options):
+        self.root = root
+        self.collection_options = collection_options
+        self.collections = {}
+
+    def _path(self, name: str):
+        return os.path.join(self.root, name)
+
+    async def get_or_create_collection(self, name: str):
+        if name not in self.collections:
+            self.collections[name] = LocalCollection(self._path(name), name, **self.collection_options)
+        return self.collections[name]
+
+    async def get_collection(self, name: str):
+        if name not in self.collections and not os.path.exists(self._path(name)):
+            raise ValueError(f"Collection {name} does not exist.")
+        return await self.get_or_create_collection(name)
+
+    async def delete_collection(self, name: str):
+        collection = self.collections.pop(name, None)
+        if collection is not None:
+            collection.vectors = None
+        shutil.rmtree(self._path(name), ignore_errors=True)
+
+    def close(self):
+        for collection in self.collections.values():
+            collection.persist()
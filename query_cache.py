@@ -0,0 +1,66 @@
+import time
+from collections import OrderedDict, defaultdict
+
+# Fields of a Chroma query response that hold one entry per query
+PER_QUERY_FIELDS = ("ids", "distances", "metadatas", "documents", "embeddings", "uris", "data")
+
+
+class QueryCache:
+    """
+    In-process LRU cache of single-query search results with a TTL.
+
+    Keys combine the collection name, the collection's write generation, the
+    whitespace-normalized query text and n_results. Writing to a collection bumps
+    its generation, so results cached before an ingest are never served after it;
+    they simply age out of the LRU.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (expires_at, result)
+        self.generations = defaultdict(int)
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return " ".join(text.split())
+
+    def key(self, collection_name: str, text: str, n_results: int):
+        return (collection_name, self.generations[collection_name], self.normalize(text), n_results)
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key, result: dict):
+        # A key minted before a write carries the old generation and can never be hit again
+        if key[1] != self.generations[key[0]]:
+            return
+        self.entries[key] = (time.monotonic() + self.ttl, result)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, collection_name: str):
+        self.generations[collection_name] += 1
+        self.invalidations += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+        }
@@ -1,21 +1,200 @@
 from base import ChromaManager
+from doc_store import DocumentStore
+from embedding_cache import EmbeddingCache, EMBEDDING_CACHE_DIR
+from query_cache import QueryCache
+from latency_stats import percentile
+from sinks import JsonlSink
+import argparse
 import asyncio
+import contextlib
+import json
+import random
+import sys
+import time
 
 NAGA_HILLS_COLLECTION_NAME = "1905_Naga_Hills_and_Manipur_by_Allen"
 SCIFACT_COLLECTION_NAME = "scifact_collection"
 SCIDOCS_COLLECTION_NAME = "scidocs_collection"
 
+BATCH_CONCURRENCY = 16
+LATENCY_SAMPLE_SIZE = 10000  # latencies kept for the summary percentiles (reservoir sample)
+
 query = "To improve energy efficiency in copper electrowinning, different technologies have been developed. These include electrode positioning capping boards and 3-D grids, electrode spacers, and segmented intercell bars. This paper introduces a design concept to avoid electrode open circuits and reduce contact resistances. The design is based on a female tooth shape for the contacts on the intercell bar. This leads to improved electrode alignment, reduced contact resistances, easier contact cleaning, and ensured electrical contact for the electrodes. It results in lower operational temperature for the electrodes, reduced plant housekeeping, increased lifespan for capping boards, and higher rate of grade A copper production. The comparative results presented should be a useful guideline for any type of intercell bar. Improvements in production levels and energy efficiency should reach 0.5% and 3%, respectively. A 3-D finite-element-based analysis and industrial measurements are used to verify the results."
 
-async def main():
-    manager = ChromaManager(collection_name=SCIDOCS_COLLECTION_NAME)
+def fetch_passages(store: DocumentStore, result: dict):
+    """Full source records behind each hit, per query, looked up by metadata['_id']."""
+    return [store.get_many([(metadata or {}).get("_id") for metadata in metadatas]) for metadatas in result["metadatas"]]
 
-    await manager.connect()
+async def iter_queries(source: str):
+    """
+    Yield (query_id, text) from a file or "-" for stdin, one line at a time.
+
+    Lines are JSON objects with `_id`/`id` and `text`/`query`, or plain text
+    whose id is its line number. Reads happen in a worker thread so a slow
+    stdin never blocks the event loop. A malformed JSON line yields
+    (line number, None, error) instead of stopping the batch.
+    """
+    f = sys.stdin if source == "-" else open(source, "r", encoding="utf-8")
+    try:
+        line_no = 0
+        while True:
+            line = await asyncio.to_thread(f.readline)
+            if not line:
+                return
+            line_no += 1
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    yield str(line_no), None, f"Invalid JSON query on line {line_no}: {e}"
+                    continue
+                yield str(record.get("_id", record.get("id", line_no))), record.get("text") or record.get("query", ""), None
+            else:
+                yield str(line_no), line, None
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+async def run_batch(
+    manager: ChromaManager,
+    source: str,
+    output: str,
+    top_k: int = 10,
+    concurrency: int = BATCH_CONCURRENCY,
+    store: DocumentStore = None,
+):
+    """
+    Run every query in `source` through manager.query and stream results to JSONL.
+
+    A reader, `concurrency` workers and the output sink are joined by bounded
+    queues, so memory stays constant however many queries there are. Records are
+    written in completion order as soon as each query finishes.
+    """
+    log = sys.stderr if output == "-" else sys.stdout
+    pending = asyncio.Queue(maxsize=2 * concurrency)
+    sink = JsonlSink(output, max_queue=4 * concurrency, mode="w")
+    await sink.start()
+    latencies, seen = [], 0
+    stats = {"ok": 0, "failed": 0}
+
+    async def reader():
+        async for item in iter_queries(source):
+            await pending.put(item)
+        for _ in range(concurrency):
+            await pending.put(None)
+
+    async def worker():
+        nonlocal seen
+        while (item := await pending.get()) is not None:
+            query_id, text, error = item
+            if error is not None:
+                stats["failed"] += 1
+                await sink.put({"id": query_id, "query": text, "error": error})
+                continue
+            start = time.perf_counter()
+            try:
+                result = await manager.query([text], n_results=top_k)
+            except Exception as e:
+                stats["failed"] += 1
+                await sink.put({"id": query_id, "query": text, "error": repr(e)})
+                continue
+            latency_ms = (time.perf_counter() - start) * 1000
 
-    result = await manager.query([query], n_results=10)
-    print(result)
+            # Reservoir sample keeps the percentile input bounded
+            seen += 1
+            if len(latencies) < LATENCY_SAMPLE_SIZE:
+                latencies.append(latency_ms)
+            elif (slot := random.randrange(seen)) < LATENCY_SAMPLE_SIZE:
+                latencies[slot] = latency_ms
 
-    await manager.disconnect()
+            metadatas = result["metadatas"][0]
+            if store is not None:
+                passages = [store.text(passage) for passage in fetch_passages(store, result)[0]]
+            else:
+                passages = result["documents"][0] if result.get("documents") else [None] * len(metadatas)
+            stats["ok"] += 1
+            await sink.put({
+                "id": query_id,
+                "query": text,
+                "ids": [(metadata or {}).get("_id") for metadata in metadatas],
+                "scores": [1.0 / (1.0 + distance) for distance in result["distances"][0]],
+                "passages": passages,
+                "latency_ms": latency_ms,
+            })
+
+    started = time.perf_counter()
+    tasks = [asyncio.create_task(reader())] + [asyncio.create_task(worker()) for _ in range(concurrency)]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    finally:
+        await sink.close()
+    wall = time.perf_counter() - started
+
+    done = stats["ok"] + stats["failed"]
+    print(f"✅ {stats['ok']} queries answered, {stats['failed']} failed in {wall:.1f}s "
+          f"({done / wall if wall else 0.0:.1f} queries/s, concurrency {concurrency})", file=log)
+    print(f"⏱️ latency p50 {percentile(latencies, 50):.1f} ms  p95 {percentile(latencies, 95):.1f} ms  "
+          f"p99 {percentile(latencies, 99):.1f} ms", file=log)
+    return {"ok": stats["ok"], "failed": stats["failed"], "wall_seconds": wall}
+
+async def main(args):
+    manager = ChromaManager(
+        collection_name=args.collection, cache=EmbeddingCache(EMBEDDING_CACHE_DIR), query_cache=QueryCache(), backend=args.backend,
+    )
+    await manager.connect()
+    store = DocumentStore(args.corpus) if args.corpus else None
+    try:
+        result = await manager.query([query], n_results=args.top_k)
+        metadatas = result["metadatas"][0] if result.get("metadatas") else [None] * len(result["distances"][0])
+        if store is not None:
+            passages = [store.text(passage) for passage in fetch_passages(store, result)[0]]
+        else:
+            passages = result["documents"][0] if result.get("documents") else [None] * len(metadatas)
+        for metadata, passage, distance in zip(metadatas, passages, result["distances"][0]):
+            print(f"📄 [{distance:.4f}] {(metadata or {}).get('title', '')}: {(passage or '')[:200]}")
+    finally:
+        if store is not None:
+            store.close()
+        await manager.disconnect()
+
+async def main_batch(args):
+    manager = ChromaManager(
+        collection_name=args.collection, cache=EmbeddingCache(EMBEDDING_CACHE_DIR), query_cache=QueryCache(),
+        backend=args.backend, max_concurrency=args.concurrency,
+    )
+    await manager.connect()
+    store = None
+    if args.corpus:
+        # Building the offset index prints progress; keep it off a JSONL stdout
+        with contextlib.redirect_stdout(sys.stderr if args.output == "-" else sys.stdout):
+            store = DocumentStore(args.corpus)
+    try:
+        await run_batch(manager, args.batch, args.output, args.top_k, args.concurrency, store)
+    finally:
+        if store is not None:
+            store.close()
+        await manager.disconnect()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Retrieve passages for one built-in query, or a batch of queries.")
+    parser.add_argument("--batch", help="File of queries (JSONL with _id/text, or one per line); '-' reads stdin")
+    parser.add_argument("--output", default="-", help="JSONL results file; '-' writes to stdout")
+    parser.add_argument("--collection", default=SCIDOCS_COLLECTION_NAME)
+    parser.add_argument("--backend", choices=["chroma", "local"], default="chroma")
+    parser.add_argument("--corpus", help="corpus.jsonl or chunk file to fetch full passages from; default: the stored documents")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    args = parser.parse_args()
+
+    if args.batch:
+        asyncio.run(main_batch(args))
+    else:
+        asyncio.run(main(args))
\ No newline at end of file
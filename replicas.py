@@ -0,0 +1,143 @@
+import asyncio
+import random
+
+import aiohttp
+
+HEALTH_INTERVAL = 5.0  # seconds between /health polls of each replica
+
+
+class Replica:
+    def __init__(self, embed_url: str):
+        self.embed_url = embed_url.rstrip("/")
+        self.health_url = self.embed_url.rsplit("/", 1)[0] + "/health"
+        self.outstanding = 0
+        self.healthy = True
+        self.requests = 0
+        self.failures = 0
+        self.hedged = 0
+        self.last_error = None
+
+
+class ReplicaPool:
+    """
+    Routes embedding requests over several replicas of the embedding service.
+
+    Each request goes to the healthy replica with the fewest outstanding
+    requests. A background task polls every replica's /health route and takes
+    replicas that fail it out of rotation until they pass again. A request still
+    running after `hedge_after` seconds is sent once more to a second replica and
+    whichever answers first wins.
+    """
+
+    def __init__(self, embed_urls: list[str], hedge_after: float = None, health_interval: float = HEALTH_INTERVAL):
+        if not embed_urls:
+            raise ValueError("At least one embedding endpoint is required")
+        self.replicas = [Replica(url) for url in embed_urls]
+        self.hedge_after = hedge_after
+        self.health_interval = health_interval
+        self._health_task = None
+
+    def __len__(self):
+        return len(self.replicas)
+
+    def pick(self, exclude: Replica = None) -> Replica:
+        """Least-outstanding healthy replica; unhealthy ones are used only if nothing else is left."""
+        candidates = [r for r in self.replicas if r is not exclude]
+        if not candidates:
+            return None
+        healthy = [r for r in candidates if r.healthy] or candidates
+        fewest = min(r.outstanding for r in healthy)
+        return random.choice([r for r in healthy if r.outstanding == fewest])
+
+    async def _call(self, replica: Replica, request):
+        replica.outstanding += 1
+        replica.requests += 1
+        try:
+            return await request(replica)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            replica.failures += 1
+            replica.last_error = repr(e)
+            if isinstance(e, aiohttp.ClientConnectionError):
+                # Unreachable: skip it until the next health poll says otherwise
+                replica.healthy = False
+            raise
+        finally:
+            replica.outstanding -= 1
+
+    async def call(self, request):
+        """
+        Run `request(replica)` on the best replica, hedging once on a second replica if it is slow.
+
+        `request` is an async callable taking a Replica; the first result wins and
+        the slower attempt is cancelled.
+        """
+        primary = self.pick()
+        first = asyncio.ensure_future(self._call(primary, request))
+        if self.hedge_after is None or len(self.replicas) < 2:
+            return await first
+
+        attempts = {first}
+        try:
+            done, attempts = await asyncio.wait(attempts, timeout=self.hedge_after)
+            if done:
+                return first.result()
+
+            secondary = self.pick(exclude=primary)
+            secondary.hedged += 1
+            attempts.add(asyncio.ensure_future(self._call(secondary, request)))
+            while attempts:
+                done, attempts = await asyncio.wait(attempts, return_when=asyncio.FIRST_COMPLETED)
+                for attempt in done:
+                    if attempt.exception() is None:
+                        return attempt.result()
+                # Both attempts failed; surface the error
+                if not attempts:
+                    return done.pop().result()
+        finally:
+            for attempt in attempts:
+                attempt.cancel()
+
+    async def check_health(self, session: aiohttp.ClientSession):
+        async def check(replica):
+            try:
+                async with session.get(replica.health_url, timeout=aiohttp.ClientTimeout(total=self.health_interval)) as resp:
+                    status = (await resp.json()).get("status") if resp.status == 200 else None
+                replica.healthy = status == "ready"
+                if not replica.healthy:
+                    replica.last_error = f"health status {resp.status} {status}"
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                replica.healthy = False
+                replica.last_error = repr(e)
+
+        await asyncio.gather(*(check(replica) for replica in self.replicas))
+
+    async def _poll_health(self, session: aiohttp.ClientSession):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            await self.check_health(session)
+
+    async def start(self, session: aiohttp.ClientSession):
+        """Start polling /health; a single replica has nowhere to fail over to, so it is not polled."""
+        if len(self.replicas) > 1 and self._health_task is None:
+            await self.check_health(session)
+            self._health_task = asyncio.create_task(self._poll_health(session))
+
+    async def stop(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            await asyncio.gather(self._health_task, return_exceptions=True)
+            self._health_task = None
+
+    def stats(self):
+        return [
+            {
+                "embed_url": r.embed_url,
+                "healthy": r.healthy,
+                "outstanding": r.outstanding,
+                "requests": r.requests,
+                "failures": r.failures,
+                "hedged": r.hedged,
+                "last_error": r.last_error,
+            }
+            for r in self.replicas
+        ]
@@ -0,0 +1,159 @@
+import asyncio
+import hashlib
+import heapq
+import time
+from collections import defaultdict, deque
+
+import numpy as np
+
+LATENCY_WINDOW = 1024  # recent query latencies kept per shard
+
+
+def shard_name(collection_name: str, shard: int, num_shards: int) -> str:
+    return f"{collection_name}_shard{shard}of{num_shards}"
+
+
+def shard_for(record_id: str, num_shards: int) -> int:
+    """Owning shard of an id; a stable hash, so routing survives restarts."""
+    digest = hashlib.blake2b(str(record_id).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") % num_shards
+
+
+class ShardedCollection:
+    """
+    One logical collection spread over N collections by id hash.
+
+    Exposes the subset of the Chroma collection API that ChromaManager uses.
+    Writes go to the shard owning each id; queries fan out to every shard
+    concurrently and the per-shard top-k lists are merged with a heap. Shards
+    can live on different Chroma servers, so a corpus can use several processes.
+    """
+
+    def __init__(self, name: str, shards: list):
+        self.name = name
+        self.shards = shards
+        self.latencies = [deque(maxlen=LATENCY_WINDOW) for _ in shards]  # seconds per shard query
+
+    def _route(self, ids):
+        """Map shard -> positions in ids owned by it."""
+        routed = defaultdict(list)
+        for position, record_id in enumerate(ids):
+            routed[shard_for(record_id, len(self.shards))].append(position)
+        return routed
+
+    @staticmethod
+    def _pick(values, positions):
+        if values is None:
+            return None
+        if isinstance(values, np.ndarray):
+            return values[positions]
+        return [values[position] for position in positions]
+
+    async def _write(self, method: str, ids, embeddings=None, metadatas=None, documents=None):
+        await asyncio.gather(*(
+            getattr(self.shards[shard], method)(
+                ids=self._pick(list(ids), positions),
+                embeddings=self._pick(embeddings, positions),
+                metadatas=self._pick(metadatas, positions),
+                documents=self._pick(documents, positions),
+            )
+            for shard, positions in self._route(ids).items()
+        ))
+
+    async def add(self, ids, embeddings=None, metadatas=None, documents=None):
+        await self._write("add", ids, embeddings, metadatas, documents)
+
+    async def upsert(self, ids, embeddings=None, metadatas=None, documents=None):
+        await self._write("upsert", ids, embeddings, metadatas, documents)
+
+    async def update(self, ids, embeddings=None, metadatas=None, documents=None):
+        await self._write("update", ids, embeddings, metadatas, documents)
+
+    async def delete(self, ids=None):
+        await asyncio.gather(*(
+            self.shards[shard].delete(ids=[ids[position] for position in positions])
+            for shard, positions in self._route(ids or []).items()
+        ))
+
+    async def count(self):
+        return sum(await asyncio.gather(*(shard.count() for shard in self.shards)))
+
+    async def get(self, ids=None, limit=None, offset=None, **kwargs):
+        """
+        Fetch records by id, or page through all shards in shard order.
+
+        Pages without ids treat the shards as one concatenated sequence, so
+        limit/offset paging works as it does on a single collection.
+        """
+        if ids is not None:
+            routed = self._route(ids)
+            pages = await asyncio.gather(*(
+                self.shards[shard].get(ids=[ids[position] for position in positions], **kwargs)
+                for shard, positions in routed.items()
+            ))
+        else:
+            counts = await asyncio.gather(*(shard.count() for shard in self.shards))
+            pages, skip, remaining = [], offset or 0, limit
+            for shard, count in zip(self.shards, counts):
+                if skip >= count:
+                    skip -= count
+                    continue
+                take = count - skip if remaining is None else min(remaining, count - skip)
+                if take <= 0:
+                    break
+                pages.append(await shard.get(limit=take, offset=skip, **kwargs))
+                skip = 0
+                if remaining is not None:
+                    remaining -= take
+
+        result = {"ids": [record_id for page in pages for record_id in page["ids"]]}
+        for field in ("embeddings", "documents", "metadatas"):
+            values = [page.get(field) for page in pages]
+            if pages and all(value is not None for value in values):
+                if any(isinstance(value, np.ndarray) for value in values):
+                    result[field] = np.concatenate([np.asarray(value, dtype=np.float32) for value in values])
+                else:
+                    result[field] = [item for value in values for item in value]
+        return result
+
+    async def _timed_query(self, shard: int, **kwargs):
+        start = time.perf_counter()
+        result = await self.shards[shard].query(**kwargs)
+        self.latencies[shard].append(time.perf_counter() - start)
+        return result
+
+    async def query(self, query_embeddings, n_results: int = 10, **kwargs):
+        """Query every shard concurrently and merge the per-query top n_results by distance."""
+        shard_results = await asyncio.gather(*(
+            self._timed_query(shard, query_embeddings=query_embeddings, n_results=n_results, **kwargs)
+            for shard in range(len(self.shards))
+        ))
+
+        fields = [field for field in ("ids", "distances", "documents", "metadatas") if all(r.get(field) is not None for r in shard_results)]
+        merged = {field: [] for field in fields}
+        for q in range(len(query_embeddings)):
+            best = heapq.nsmallest(n_results, (
+                (distance, shard, rank)
+                for shard, result in enumerate(shard_results)
+                for rank, distance in enumerate(result["distances"][q])
+            ))
+            for field in fields:
+                merged[field].append([shard_results[shard][field][q][rank] for _, shard, rank in best])
+        return merged
+
+    def latency_report(self) -> dict:
+        """Recent per-shard query latency in milliseconds."""
+        report = {}
+        for shard, latencies in enumerate(self.latencies):
+            values = sorted(latencies)
+            report[shard] = {
+                "queries": len(values),
+                "mean_ms": 1000 * sum(values) / len(values) if values else 0.0,
+                "p95_ms": 1000 * values[min(len(values) - 1, int(0.95 * len(values)))] if values else 0.0,
+                "max_ms": 1000 * values[-1] if values else 0.0,
+            }
+        return report
+
+    def reset_latencies(self):
+        for latencies in self.latencies:
+            latencies.clear()
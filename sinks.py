@@ -0,0 +1,82 @@
+import asyncio
+import json
+import random
+import sys
+
+
+class JsonlSink:
+    """
+    Asynchronous, sampled JSONL writer for diagnostics.
+
+    write() never blocks the caller: records are sampled, queued, and written by a
+    background task that does the file I/O in a worker thread. When the queue is
+    full new records are dropped (and counted) rather than slowing the hot path.
+    """
+
+    def __init__(self, path: str, sample_rate: float = 1.0, max_queue: int = 1024, mode: str = "a"):
+        self.path = path  # "-" writes to stdout
+        self.mode = mode
+        self.sample_rate = sample_rate
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self.written = 0
+        self._file = None
+        self._task = None
+
+    async def start(self):
+        if self._task is None:
+            if self.path == "-":
+                self._file = sys.stdout
+            else:
+                self._file = await asyncio.to_thread(open, self.path, self.mode, encoding="utf-8")
+            self._task = asyncio.create_task(self._run())
+        return self
+
+    def sampled(self) -> bool:
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    def write(self, record: dict, sample: bool = True) -> bool:
+        """Queue a record; returns False if it was sampled out or dropped."""
+        if self._task is None or (sample and not self.sampled()):
+            return False
+        try:
+            self.queue.put_nowait(record)
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+
+    async def put(self, record: dict):
+        """Queue a record, waiting for room instead of dropping it; for output that must be complete."""
+        await self.queue.put(record)
+        return True
+
+    async def _run(self):
+        while True:
+            record = await self.queue.get()
+            if record is None:
+                break
+            lines = [json.dumps(record, ensure_ascii=False)]
+            # Drain whatever else is waiting so each thread hop writes a batch
+            while not self.queue.empty():
+                extra = self.queue.get_nowait()
+                if extra is None:
+                    await asyncio.to_thread(self._write_lines, lines)
+                    return
+                lines.append(json.dumps(extra, ensure_ascii=False))
+            await asyncio.to_thread(self._write_lines, lines)
+
+    def _write_lines(self, lines):
+        self._file.write("\n".join(lines) + "\n")
+        self._file.flush()
+        self.written += len(lines)
+
+    async def close(self):
+        if self._task is None:
+            return
+        await self.queue.put(None)
+        await self._task
+        self._task = None
+        if self._file is not sys.stdout:
+            await asyncio.to_thread(self._file.close)
+        self._file = None
@@ -0,0 +1,134 @@
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+SNAPSHOT_PAGE_SIZE = 1000
+RESTORE_BATCH_SIZE = 5000  # below Chroma's default max batch size
+COLUMNS = ("ids", "documents", "metadatas")
+
+
+async def export_collection(collection, directory: str, page_size: int = SNAPSHOT_PAGE_SIZE, name: str = None) -> dict:
+    """
+    Write a collection to `directory` without touching the embedding service.
+
+    The snapshot holds vectors.f32 (a row-major float32 matrix) plus one JSONL
+    file per column (ids, documents, metadatas) whose line i describes row i.
+    It is assembled in a temporary directory and renamed into place when done,
+    so a half-written snapshot is never mistaken for a complete one.
+    """
+    tmp_dir = directory.rstrip("/\\") + ".partial"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    count, dim, offset = 0, None, 0
+    files = {column: open(os.path.join(tmp_dir, f"{column}.jsonl"), "w", encoding="utf-8") for column in COLUMNS}
+    try:
+        with open(os.path.join(tmp_dir, "vectors.f32"), "wb") as vectors:
+            while True:
+                page = await collection.get(include=["embeddings", "documents", "metadatas"], limit=page_size, offset=offset)
+                ids = page["ids"]
+                if not ids:
+                    break
+                embeddings = np.asarray(page["embeddings"], dtype=np.float32)
+                dim = embeddings.shape[1] if dim is None else dim
+                if embeddings.shape != (len(ids), dim):
+                    raise ValueError(f"Unexpected embedding page shape {embeddings.shape} at offset {offset}")
+                vectors.write(np.ascontiguousarray(embeddings, dtype="<f4").tobytes())
+                for column in COLUMNS:
+                    values = page.get(column) or [None] * len(ids)
+                    files[column].write("".join(json.dumps(value, ensure_ascii=False) + "\n" for value in values))
+                count += len(ids)
+                offset += len(ids)
+                print(f"Exported {count} records")
+                if len(ids) < page_size:
+                    break
+    finally:
+        for f in files.values():
+            f.close()
+
+    manifest = {
+        "name": name,
+        "count": count,
+        "dim": dim or 0,
+        "dtype": "<f4",
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+    with open(os.path.join(tmp_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(tmp_dir, directory)
+    return manifest
+
+
+def read_manifest(directory: str) -> dict:
+    with open(os.path.join(directory, "manifest.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+async def import_snapshot(collection, directory: str, batch_size: int = RESTORE_BATCH_SIZE) -> int:
+    """
+    Upsert every record of a snapshot into `collection` in large batches.
+
+    Vectors are memory-mapped and the column files are read in step with them,
+    so memory use is bounded by one batch whatever the snapshot size.
+    """
+    manifest = read_manifest(directory)
+    count, dim = manifest["count"], manifest["dim"]
+    if count == 0:
+        return 0
+    vectors = np.memmap(os.path.join(directory, "vectors.f32"), dtype=manifest["dtype"], mode="r", shape=(count, dim))
+    files = {column: open(os.path.join(directory, f"{column}.jsonl"), "r", encoding="utf-8") for column in COLUMNS}
+    restored = 0
+    try:
+        while restored < count:
+            stop = min(restored + batch_size, count)
+            columns = {column: [json.loads(files[column].readline()) for _ in range(stop - restored)] for column in COLUMNS}
+            await collection.upsert(
+                ids=columns["ids"],
+                embeddings=np.asarray(vectors[restored:stop], dtype=np.float32),
+                documents=columns["documents"] if any(doc is not None for doc in columns["documents"]) else None,
+                metadatas=columns["metadatas"] if any(meta is not None for meta in columns["metadatas"]) else None,
+            )
+            restored = stop
+            print(f"Restored {restored}/{count} records")
+    finally:
+        for f in files.values():
+            f.close()
+    return restored
+
+
+if __name__ == "__main__":
+    from base import ChromaManager
+
+    parser = argparse.ArgumentParser(description="Export or restore a collection snapshot without re-embedding.")
+    parser.add_argument("action", choices=["export", "import"])
+    parser.add_argument("collection")
+    parser.add_argument("directory")
+    parser.add_argument("--backend", choices=["chroma", "local"], default="chroma")
+    parser.add_argument("--shards", type=int, default=1)
+    parser.add_argument("--page-size", type=int, default=SNAPSHOT_PAGE_SIZE)
+    parser.add_argument("--batch-size", type=int, default=RESTORE_BATCH_SIZE)
+    args = parser.parse_args()
+
+    async def main():
+        manager = ChromaManager(collection_name=args.collection, backend=args.backend, num_shards=args.shards)
+        await manager.connect()
+        start = time.perf_counter()
+        try:
+            if args.action == "export":
+                manifest = await manager.export_snapshot(args.directory, page_size=args.page_size)
+                print(f"💾 Exported {manifest['count']} records of '{args.collection}' to '{args.directory}' in {time.perf_counter() - start:.1f}s")
+            else:
+                restored = await manager.import_snapshot(args.directory, batch_size=args.batch_size)
+                print(f"♻️ Restored {restored} records into '{args.collection}' in {time.perf_counter() - start:.1f}s")
+        finally:
+            await manager.disconnect()
+
+    asyncio.run(main())
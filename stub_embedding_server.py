@@ -0,0 +1,98 @@
+import argparse
+import asyncio
+import hashlib
+import json
+
+import numpy as np
+from aiohttp import web
+
+from embedding_codec import BINARY_MEDIA_TYPE, MSGPACK_MEDIA_TYPE, DTYPES, msgpack
+
+STUB_PORT = 8001
+EMBEDDING_DIM = 1024
+
+
+def stub_embedding(text: str, dim: int = EMBEDDING_DIM):
+    """Deterministic unit vector derived from the text, standing in for the real model."""
+    seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def create_app(dim: int = EMBEDDING_DIM, latency_ms: float = 0.0):
+    """
+    aiohttp app exposing the same routes as jina-embeddings-v3-api/app.py.
+
+    latency_ms adds a fixed delay per request to imitate model forward time.
+    """
+
+    async def delay():
+        if latency_ms:
+            await asyncio.sleep(latency_ms / 1000.0)
+
+    async def health(request):
+        return web.json_response({"device": "stub", "model_name": "stub", "status": "ready"})
+
+    def respond(request, embeddings, single):
+        accept = request.headers.get("Accept", "")
+        if BINARY_MEDIA_TYPE not in accept and MSGPACK_MEDIA_TYPE not in accept:
+            embeddings = [embedding.tolist() for embedding in embeddings]
+            return web.json_response({"embedding": embeddings[0]} if single else {"embeddings": embeddings})
+
+        dtype = request.headers.get("X-Embedding-Dtype", "float32")
+        array = np.asarray(embeddings, dtype=DTYPES[dtype]).reshape(len(embeddings), dim)
+        if MSGPACK_MEDIA_TYPE in accept:
+            body = msgpack.packb({"dtype": dtype, "shape": list(array.shape), "data": array.tobytes()})
+            return web.Response(body=body, content_type=MSGPACK_MEDIA_TYPE)
+        headers = {"X-Embedding-Dtype": dtype, "X-Embedding-Shape": f"{array.shape[0]},{array.shape[1]}"}
+        return web.Response(body=array.tobytes(), content_type=BINARY_MEDIA_TYPE, headers=headers)
+
+    async def embed(request):
+        data = await request.json()
+        await delay()
+        return respond(request, [stub_embedding(data["text"], dim)], single=True)
+
+    async def embed_batch(request):
+        data = await request.json()
+        await delay()
+        return respond(request, [stub_embedding(text, dim) for text in data["texts"]], single=False)
+
+    async def embed_stream(request):
+        """NDJSON {id, text} in, NDJSON {id, embedding} out, in input order."""
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+        async for line in request.content:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            await delay()
+            out = {"id": record.get("id"), "embedding": stub_embedding(record["text"], dim).tolist()}
+            await response.write((json.dumps(out) + "\n").encode("utf-8"))
+        await response.write_eof()
+        return response
+
+    app = web.Application()
+    app.router.add_get("/health", health)
+    app.router.add_post("/embed", embed)
+    app.router.add_post("/embed/batch", embed_batch)
+    app.router.add_post("/embed/stream", embed_stream)
+    return app
+
+
+async def start_stub_server(host: str = "127.0.0.1", port: int = STUB_PORT, **app_options):
+    """Start the stub in the running event loop; call `await runner.cleanup()` to stop it."""
+    runner = web.AppRunner(create_app(**app_options))
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub embedding server for running benchmarks without the model.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=STUB_PORT)
+    parser.add_argument("--dim", type=int, default=EMBEDDING_DIM)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    web.run_app(create_app(args.dim, args.latency_ms), host=args.host, port=args.port)
@@ -0,0 +1,98 @@
+import contextvars
+import time
+import uuid
+from contextlib import contextmanager
+
+from sinks import JsonlSink
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Tracer:
+    """
+    Instrumentation hook for the retrieval client; the base class records nothing.
+
+    ChromaManager and ChromaRetriever wrap each stage in `with tracer.span(name, **attrs)`.
+    Subclasses override `record` to send finished spans somewhere.
+    """
+
+    enabled = False
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        if not self.enabled:
+            yield attrs
+            return
+        parent = _current_span.get()
+        span = {
+            "trace_id": parent["trace_id"] if parent else uuid.uuid4().hex[:16],
+            "span_id": uuid.uuid4().hex[:16],
+            "parent_id": parent["span_id"] if parent else None,
+            "name": name,
+        }
+        token = _current_span.set(span)
+        start = time.perf_counter()
+        wall_start = time.time()
+        try:
+            yield attrs
+        except BaseException as e:
+            attrs["error"] = repr(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span["start"] = wall_start
+            span["duration_ms"] = (time.perf_counter() - start) * 1000
+            span["attrs"] = attrs
+            self.record(span)
+
+    def record(self, span: dict):
+        pass
+
+
+class JsonlTracer(Tracer):
+    """
+    Writes every finished span as a JSONL line and keeps per-stage totals.
+
+    Lines go through a JsonlSink, so tracing never blocks the query path; traces
+    are sampled whole (a sampled root decides for all of its children).
+    """
+
+    enabled = True
+
+    def __init__(self, path: str, sample_rate: float = 1.0):
+        self.sink = JsonlSink(path, sample_rate=sample_rate)
+        self.totals = {}  # span name -> [count, total ms]
+        self._sampled = {}  # trace_id -> sampled?
+
+    async def start(self):
+        await self.sink.start()
+
+    async def close(self):
+        await self.sink.close()
+
+    def record(self, span: dict):
+        count_ms = self.totals.setdefault(span["name"], [0, 0.0])
+        count_ms[0] += 1
+        count_ms[1] += span["duration_ms"]
+
+        trace_id = span["trace_id"]
+        sampled = self._sampled.get(trace_id)
+        if sampled is None:
+            sampled = self._sampled[trace_id] = self.sink.sampled()
+        if span["parent_id"] is None:
+            self._sampled.pop(trace_id, None)
+        if sampled:
+            self.sink.write(span, sample=False)
+
+    def summary(self) -> dict:
+        """{span name: {"count", "total_ms", "mean_ms"}} over every span seen."""
+        return {
+            name: {"count": count, "total_ms": total, "mean_ms": total / count if count else 0.0}
+            for name, (count, total) in sorted(self.totals.items(), key=lambda item: -item[1][1])
+        }